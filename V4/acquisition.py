@@ -0,0 +1,256 @@
+from collections import namedtuple
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from pipeline import BlockPipeline
+from interlock import Interlock
+from livefeed import LiveFeedWriter
+from trigger import CaptureTrigger
+
+
+# Acquisition runs in its own process so nothing the GUI does (rendering, exports,
+# modal dialogs, all holding the GIL) can delay a read. The child owns the DAQ task
+# and the interlock output, runs the block pipeline and writes every block with its
+# reduction into a ring of shared memory slots. It then announces the block on the
+# event queue, which also carries alarms, trips, errors and log records, in order.
+# The GUI process only reads the ring.
+
+log = logging.getLogger(__name__)
+
+# Everything the child needs, sent once when it is spawned. lut, alarms and
+# streamFilter are fresh objects from main.py, channels a ChannelConfig per sensor and
+# bufferSamples the DAQmx buffer per channel from the acquisition plan.
+# The interlock is created in the child because its DAQ task cannot cross processes.
+AcquisitionConfig = namedtuple("AcquisitionConfig", ["deviceID", "nr_channels", "samplingRate", "readRate", "simulate",
+                                                     "lut", "alarms", "streamFilter", "interlock", "feed", "capture", "unit", "slots",
+                                                     "logLevel", "channels", "bufferSamples"])
+
+# One ring slot as read back by the GUI; block is None unless it was asked for.
+# Times ending in Ns are perf_counter_ns of the acquisition process, which is the
+# same clock as in the GUI process.
+BlockRecord = namedtuple("BlockRecord", ["seq", "timestamp", "pressures", "voltages", "status", "block",
+                                         "readStartNs", "readEndNs", "processEndNs", "available"])
+
+
+class BlockRing:
+    # seq is cleared before a slot is rewritten and set after, so a reader that sees
+    # the same seq before and after copying has a consistent slot. A reader that is
+    # more than `slots` blocks behind finds the slot reused and skips the block.
+
+    def __init__(self, nr_channels, nr_samples, slots, name=None):
+        self.dtype = np.dtype([("seq", "<u8"), ("timestamp", "<f8"), ("readStartNs", "<i8"), ("readEndNs", "<i8"),
+                               ("processEndNs", "<i8"), ("available", "<i8"), ("pressures", "<f8", (nr_channels,)),
+                               ("voltages", "<f8", (nr_channels,)), ("status", "u1", (nr_channels,)),
+                               ("block", "<f8", (nr_channels, nr_samples))], align=True)
+        self.shape = (nr_channels, nr_samples)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=self.dtype.itemsize * slots)
+        self.name = self.memory.name
+        self.slots = np.ndarray((slots,), dtype=self.dtype, buffer=self.memory.buf)
+        # Field views, each slot of these is contiguous
+        self.seq = self.slots["seq"]
+        self.block = self.slots["block"]
+        self.header = self.slots[["timestamp", "readStartNs", "readEndNs", "processEndNs", "available", "pressures", "voltages", "status"]]
+        if name is None:
+            self.seq[:] = 0
+
+    def index(self, seq):
+        return seq % len(self.slots)
+
+    def read(self, seq, withBlock=False):
+        # None when the slot has already been reused for a later block
+        i = self.index(seq)
+        if self.seq[i] != seq:
+            return None
+        header = self.header[i:i + 1].copy()[0]
+        block = self.block[i].copy() if withBlock else None
+        if self.seq[i] != seq:
+            return None
+        return BlockRecord(seq, float(header["timestamp"]), header["pressures"], header["voltages"], header["status"], block,
+                           int(header["readStartNs"]), int(header["readEndNs"]), int(header["processEndNs"]), int(header["available"]))
+
+    def close(self):
+        self.slots = self.seq = self.block = self.header = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+class SimulatedSource:
+    # Stands in for AnalogInStream when DEBUG is set: a random level per channel and
+    # block plus noise, paced to the read rate
+    def __init__(self, nr_channels, nr_samples, readRate):
+        self.nr_channels = nr_channels
+        self.nr_samples = nr_samples
+        self.readRate = readRate
+        self.deadline = None
+        self.lastAvailable = 0
+
+    def configureClock(self, sample_rate, bufferSamples=None):
+        pass
+
+    def acquire_data(self, out):
+        now = time.perf_counter()
+        self.deadline = now if self.deadline is None else max(self.deadline + self.readRate, now)
+        time.sleep(max(self.deadline - now, 0))
+        level = np.random.uniform(0.2, 9.8, (self.nr_channels, 1))
+        np.add(level, np.random.normal(0, 0.01, (self.nr_channels, self.nr_samples)), out=out)
+        return out
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+def acquire(config, ringName, events, control):
+    # Entry point of the acquisition process
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(events)]
+    root.setLevel(config.logLevel)
+
+    nr_samples = int(config.readRate * config.samplingRate)
+    ring = BlockRing(config.nr_channels, nr_samples, config.slots, ringName)
+    try:
+        interlock = Interlock.fromSettings(config.interlock, config.deviceID, config.nr_channels, config.unit, config.simulate)
+    except Exception as e:
+        events.put(("error", f"Interlock output could not be created: {e}"))
+        ring.close()
+        events.put(("stopped",))
+        return
+    pipeline = BlockPipeline(config.nr_channels, config.lut, config.alarms, interlock, config.streamFilter)
+
+    feed = capture = None
+    try:
+        feed = LiveFeedWriter.fromSettings(config.feed, config.nr_channels, config.unit, time.time())
+        capture = CaptureTrigger.fromSettings(config.capture, config.lut, config.nr_channels, nr_samples, config.samplingRate,
+                                              config.readRate, lambda path: events.put(("capture", path)))
+        if config.simulate:
+            source = SimulatedSource(config.nr_channels, nr_samples, config.readRate)
+        else:
+            from daq import AnalogInStream
+            source = AnalogInStream(config.deviceID, nr_samples, config.channels)
+        with source:
+            source.configureClock(config.samplingRate, config.bufferSamples)
+            events.put(("started",))
+            acquireBlocks(source, ring, pipeline, interlock, feed, capture, events, control)
+    except Exception as e:
+        log.exception("Acquisition failed")
+        events.put(("error", str(e)))
+    finally:
+        # The interlock output is left in its last state so a tripped valve stays closed
+        pipeline.close()
+        if feed is not None:
+            feed.close()
+        if capture is not None:
+            capture.close()
+        ring.close()
+        events.put(("stopped",))
+
+
+def acquireBlocks(source, ring, pipeline, interlock, feed, capture, events, control):
+    # Blocks are read straight into their ring slot. Kept apart from acquire so no
+    # view of the ring outlives it and the ring can be closed afterwards.
+    seq = 0
+    while True:
+        while True:
+            try:
+                command = control.get_nowait()
+            except queue.Empty:
+                break
+            if command == "stop":
+                return
+            if command == "reset" and interlock is not None:
+                interlock.reset()
+
+        seq += 1
+        i = ring.index(seq)
+        ring.seq[i] = 0
+        readStart = time.perf_counter_ns()
+        data = source.acquire_data(out=ring.block[i])
+        readTime = time.perf_counter()
+        readEnd = time.perf_counter_ns()
+        result = pipeline.process(data, time.time(), readTime)
+
+        slot = ring.slots[i:i + 1]
+        slot["timestamp"] = result.timestamp
+        slot["pressures"] = result.pressures
+        slot["voltages"] = result.voltages
+        slot["status"] = result.status
+        slot["readStartNs"] = readStart
+        slot["readEndNs"] = readEnd
+        slot["processEndNs"] = time.perf_counter_ns()
+        slot["available"] = source.lastAvailable
+        ring.seq[i] = seq
+        if feed is not None:
+            feed.write(result.timestamp, result.pressures, result.status)
+
+        if result.trip is not None:
+            events.put(("trip", result.trip))
+        if result.alarms:
+            events.put(("alarms", result.alarms))
+        events.put(("block", seq))
+        # After the block is announced, so triggers never delay the GUI or the interlock
+        if capture is not None:
+            capture.process(data, result.timestamp, result.pressures)
+
+
+class AcquisitionProcess:
+    # GUI side of the acquisition process: owns the ring and the two queues
+
+    def __init__(self, config):
+        nr_samples = int(config.readRate * config.samplingRate)
+        self.ring = BlockRing(config.nr_channels, nr_samples, config.slots)
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.control = context.Queue()
+        self.process = context.Process(target=acquire, args=(config, self.ring.name, self.events, self.control),
+                                       name="Acquisition", daemon=True)
+        self.joinTimeout = config.readRate + 5
+        # stop and resetInterlock come from the GUI thread and may race close on the
+        # reader thread, e.g. when an error stops the run; once closed they do nothing
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        self.command("stop")
+
+    def resetInterlock(self):
+        self.command("reset")
+
+    def command(self, command):
+        with self.lock:
+            if not self.closed:
+                self.control.put(command)
+
+    def next(self, timeout):
+        # Next event, or None when there was none within timeout seconds
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def isAlive(self):
+        return self.process.is_alive()
+
+    def close(self):
+        self.process.join(self.joinTimeout)
+        if self.process.is_alive():
+            log.warning("Acquisition process did not stop, terminating it")
+            self.process.terminate()
+            self.process.join()
+        with self.lock:
+            self.closed = True
+            self.events.close()
+            self.control.close()
+        self.ring.close()
+        self.ring.unlink()
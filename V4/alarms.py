@@ -0,0 +1,62 @@
+from collections import namedtuple
+import numpy as np
+from gauge import convertPressure
+
+
+AlarmEvent = namedtuple("AlarmEvent", ["timestamp", "sensor", "kind", "active", "value"])
+
+
+class AlarmEngine:
+    # Rows of the condition matrices, one column per sensor
+    KINDS = ["high", "low", "rise"]
+
+    def __init__(self, nr_channels, blockTime, sensors=(), hysteresis=0.05, debounce=1, unit="mbar"):
+        self.nr_channels = nr_channels
+        self.blockTime = blockTime
+        self.hysteresis = hysteresis
+        self.debounce = max(1, int(debounce))
+
+        # Unset thresholds never trip: +inf for high/rise and 0 for low
+        self.limits = np.array([[np.inf] * nr_channels, [0.0] * nr_channels, [np.inf] * nr_channels])
+        for i, sensor in enumerate(list(sensors)[:nr_channels]):
+            for row, kind in enumerate(AlarmEngine.KINDS):
+                if sensor.get(kind) is not None:
+                    self.limits[row, i] = float(sensor[kind])
+
+        # Pressure thresholds are configured in mbar, rise is unit independent (decades/s)
+        self.limits[:2] = convertPressure(self.limits[:2], "mbar", unit)
+        self.clearLimits = self.limits * np.array([[1 - hysteresis], [1 + hysteresis], [1 - hysteresis]])
+
+        self.active = np.zeros((3, nr_channels), dtype=bool)
+        self.counter = np.zeros((3, nr_channels), dtype=np.int32)
+        self.lastLog = None
+
+    @classmethod
+    def fromSettings(cls, nr_channels, blockTime, settings, unit="mbar"):
+        return cls(nr_channels, blockTime, settings.get("sensors", []), settings.get("hysteresis", 0.05),
+                   settings.get("debounce", 1), unit)
+
+    def evaluate(self, pressures, timestamp):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logPressure = np.log10(pressures)
+            rise = (logPressure - self.lastLog) / self.blockTime if self.lastLog is not None else np.full(self.nr_channels, np.nan)
+        self.lastLog = logPressure
+
+        values = np.stack([pressures, pressures, rise])
+        trip = np.stack([pressures > self.limits[0], pressures < self.limits[1], rise > self.limits[2]])
+        clear = np.stack([pressures < self.clearLimits[0], pressures > self.clearLimits[1], rise < self.clearLimits[2]])
+
+        # An alarm only changes state after the opposite condition held for `debounce` blocks
+        wanted = np.where(self.active, ~clear, trip)
+        self.counter = np.where(wanted != self.active, self.counter + 1, 0)
+        changed = self.counter >= self.debounce
+        if not changed.any():
+            return []
+
+        self.active ^= changed
+        self.counter[changed] = 0
+        return [AlarmEvent(timestamp, int(sensor), AlarmEngine.KINDS[row], bool(self.active[row, sensor]), float(values[row, sensor]))
+                for row, sensor in zip(*np.nonzero(changed))]
+
+    def activeKinds(self, sensor):
+        return [kind for row, kind in enumerate(AlarmEngine.KINDS) if self.active[row, sensor]]
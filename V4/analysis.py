@@ -0,0 +1,64 @@
+from collections import deque
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# Segments attached by this worker process, kept open for the life of the pool
+_attached = {}
+
+
+def _runTask(function, name, shape, dtype, slot, args):
+    # Pool workers share the parent's resource tracker, which already owns the segment
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    ring = np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf)
+    return function(ring[slot], *args)
+
+
+class AnalysisExecutor:
+    # Runs per block analysis in worker processes. Blocks are copied once into a ring
+    # of shared memory slots and the workers read them in place, so only the slot
+    # number and the (small) result cross the process boundary. Results come back in
+    # submission order. When every slot is busy the block is skipped rather than
+    # making the caller wait, so acquisition never stalls on analysis.
+
+    def __init__(self, blockShape, processes=2, slots=8, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.shape = (slots,) + tuple(blockShape)
+        self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.ring = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+        self.free = deque(range(slots))
+        self.pending = deque()
+        self.dropped = 0
+        self.pool = multiprocessing.get_context("spawn").Pool(processes)
+
+    def submit(self, function, block, *args):
+        # function must be a module level function taking (block, *args)
+        if not self.free or block.shape != self.shape[1:]:
+            self.dropped += 1
+            return False
+
+        slot = self.free.popleft()
+        self.ring[slot] = block
+        result = self.pool.apply_async(_runTask, (function, self.memory.name, self.shape, self.dtype.str, slot, args))
+        self.pending.append((slot, result))
+        return True
+
+    def collect(self, wait=False):
+        # Finished results in submission order, stopping at the first unfinished one
+        results = []
+        while self.pending and (wait or self.pending[0][1].ready()):
+            slot, result = self.pending.popleft()
+            try:
+                results.append(result.get())
+            finally:
+                self.free.append(slot)
+        return results
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.ring = None
+        self.memory.close()
+        self.memory.unlink()
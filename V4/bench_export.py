@@ -0,0 +1,141 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from export import FORMATS, XLSX_MAX_ROWS
+from pressurelog import PressureLog
+
+
+# Export benchmark over synthetic run logs of every size x sensor count, timing the
+# export and the reload of each format and recording the peak Python allocation
+# (tracemalloc, in a separate pass so it does not slow the timed one) and file size, e.g.
+#   python bench_export.py --sizes 10000 100000 --sensors 1 16 --save-baseline export_baseline.json
+#   python bench_export.py --sizes 10000 100000 --sensors 1 16 --baseline export_baseline.json
+# With --baseline it exits with 1 when the export or reload throughput (rows/s) of any
+# case has dropped by more than --threshold against the baseline.
+
+def syntheticLog(rows, sensors, seed=0):
+    # Pump-down curves from 1000 mbar with noise, 0.5 s apart, and an occasional bad status
+    rng = np.random.default_rng(seed)
+    t = 1.7e9 + np.arange(rows) * 0.5
+    decay = np.linspace(0, 10, rows)[:, None] * rng.uniform(0.5, 1.5, sensors)
+    pressures = 1e3 * 10.0 ** -decay * 10.0 ** rng.normal(0, 0.01, (rows, sensors)) + 1e-8
+    status = np.where(rng.random((rows, sensors)) < 0.001, 3, 0).astype(np.uint8)
+    return PressureLog.fromArrays(t, pressures, status, "mbar")
+
+
+def available(extension):
+    # Reason a format cannot be measured here, None when it can
+    try:
+        if extension == ".xlsx":
+            import openpyxl
+        elif extension == ".parquet":
+            import pyarrow
+    except ImportError as e:
+        return f"{e.name} not installed"
+    return None
+
+
+def measure(log, extension, directory, memory, repeat=1):
+    # Best of repeat runs, which is the least disturbed by the rest of the machine
+    writer, reader = FORMATS[extension]
+    path = os.path.join(directory, "export" + extension)
+    exportTime = reloadTime = float("inf")
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        writer(log, path, "mbar")
+        exportTime = min(exportTime, time.perf_counter() - start)
+        gc.collect()
+        start = time.perf_counter()
+        reader(path)
+        reloadTime = min(reloadTime, time.perf_counter() - start)
+    size = os.path.getsize(path)
+
+    result = {"export_s": exportTime, "reload_s": reloadTime, "size_mb": size / 1e6,
+              "export_rows_s": len(log) / exportTime, "reload_rows_s": len(log) / reloadTime}
+    if memory:
+        os.remove(path)
+        gc.collect()
+        tracemalloc.start()
+        writer(log, path, "mbar")
+        result["export_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    os.remove(path)
+    return result
+
+
+def compare(results, baseline, threshold):
+    # Cases whose throughput fell below (1 - threshold) of the baseline
+    failures = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None or "skipped" in result or "skipped" in reference:
+            continue
+        for metric in ("export_rows_s", "reload_rows_s"):
+            if result[metric] < reference[metric] * (1 - threshold):
+                failures.append(f"{key} {metric}: {result[metric]:.0f} rows/s, baseline {reference[metric]:.0f} rows/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure export and reload time, memory and size of every export format")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000, 10000000], help="rows per log")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument("--max-mb", type=float, default=1000.0, help="skip logs larger than this in memory (MB)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--baseline", help="JSON from --save-baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed throughput drop against the baseline (0.25 = 25 %%)")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<28}{'export s':>10}{'rows/s':>12}{'peak MB':>10}{'size MB':>10}{'reload s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        # One small untimed round per format, so lazy imports (pandas, the Excel engine)
+        # are not counted in the first case
+        for extension in args.formats:
+            if available(extension) is None:
+                measure(syntheticLog(100, 1), extension, directory, False)
+        for rows in args.sizes:
+            for sensors in args.sensors:
+                logSize = rows * (8 + 9 * sensors) / 1e6
+                log = syntheticLog(rows, sensors) if logSize <= args.max_mb else None
+                for extension in args.formats:
+                    key = f"{extension[1:]}/{rows}/{sensors}"
+                    reason = available(extension)
+                    if log is None:
+                        reason = f"log of {logSize:.0f} MB is above --max-mb"
+                    elif extension == ".xlsx" and rows > XLSX_MAX_ROWS:
+                        reason = "above Excel's row limit"
+                    if reason is not None:
+                        results[key] = {"skipped": reason}
+                        print(f"{key:<28}skipped, {reason}")
+                        continue
+                    result = results[key] = measure(log, extension, directory, not args.no_memory, args.repeat)
+                    print(f"{key:<28}{result['export_s']:>10.3f}{result['export_rows_s']:>12.0f}"
+                          f"{result.get('export_peak_mb', float('nan')):>10.1f}{result['size_mb']:>10.1f}{result['reload_s']:>10.3f}")
+                del log
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures = compare(results, json.load(file), args.threshold)
+        for failure in failures:
+            print("Regression:", failure)
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
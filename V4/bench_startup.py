@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Cold start benchmark. Every run is a fresh interpreter that imports main, builds the
+# window and waits for its first paint and for the background device scan, e.g.
+#   python bench_startup.py --runs 5 --max-paint 1500
+# Exits with 1 when the median first paint is above --max-paint (ms).
+
+def child():
+    start = time.perf_counter()
+    times = {}
+    import main
+    times["import"] = time.perf_counter() - start
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    window = main.MainWindow()
+    times["window"] = time.perf_counter() - start
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and "paint" not in times:
+                times["paint"] = time.perf_counter() - start
+            return False
+
+    def devicesFound(devices):
+        times["devices"] = time.perf_counter() - start
+        QTimer.singleShot(0, app.quit)
+
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.device_watcher.devices_changed.connect(devicesFound)
+    window.show()
+    QTimer.singleShot(10000, app.quit)
+    app.exec_()
+    times.setdefault("paint", times["window"])
+    print(json.dumps({key: value * 1000 for key, value in times.items()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import, first paint and device scan time of main.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-paint", type=float, default=None, help="fail when the median first paint is above this (ms)")
+    parser.add_argument("--offscreen", action="store_true", help="use the offscreen Qt platform (no display needed)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    results = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        wall = (time.perf_counter() - start) * 1000
+        times = json.loads(output.strip().splitlines()[-1])
+        times["process"] = wall
+        results.append(times)
+
+    print(f"{'stage':<10}{'median ms':>12}{'max ms':>12}")
+    for key in ("import", "window", "paint", "devices", "process"):
+        values = [result[key] for result in results if key in result]
+        if values:
+            print(f"{key:<10}{statistics.median(values):>12.1f}{max(values):>12.1f}")
+
+    paint = statistics.median(result["paint"] for result in results)
+    if args.max_paint is not None and paint > args.max_paint:
+        print(f"First paint {paint:.1f} ms is above {args.max_paint:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child()
+    else:
+        sys.exit(main())
@@ -0,0 +1,104 @@
+import json
+import os
+import numpy as np
+from config import CONFIG_DIR
+from gauge import voltageToPressure, convertPressure
+
+
+CALIBRATION_FILE = os.path.join(CONFIG_DIR, "calibration.json")
+
+
+class GaugeCalibration:
+    # Corrected voltage = gain * U + offset. A custom curve of (voltage, mbar) points
+    # replaces the FRG law and is interpolated in log pressure.
+
+    def __init__(self, serial="", offset=0.0, gain=1.0, curve=None):
+        self.serial = serial
+        self.offset = float(offset)
+        self.gain = float(gain)
+        self.curve = sorted((float(u), float(p)) for u, p in curve) if curve else None
+
+    @classmethod
+    def fromDict(cls, serial, data):
+        return cls(serial, data.get("offset", 0.0), data.get("gain", 1.0), data.get("curve"))
+
+    def toDict(self):
+        data = {"offset": self.offset, "gain": self.gain}
+        if self.curve:
+            data["curve"] = [list(point) for point in self.curve]
+        return data
+
+    def pressure(self, voltage, unit="mbar"):
+        corrected = self.gain * np.asarray(voltage, dtype=np.float64) + self.offset
+        if not self.curve:
+            return voltageToPressure(corrected, unit)
+
+        u, p = np.array(self.curve).T
+        return convertPressure(10.0 ** np.interp(corrected, u, np.log10(p)), "mbar", unit)
+
+
+class PressureLUT:
+    # Dense table of pressures over VMIN..VMAX per channel. With 4096 steps of 2.4 mV
+    # linear interpolation stays within 1.1e-5 relative of the exponential law, so
+    # converting is a gather and a multiply-add instead of a power per sample.
+    VMIN = 0.0
+    VMAX = 10.0
+    SIZE = 4096
+
+    def __init__(self, calibrations, unit="mbar", size=SIZE):
+        self.unit = unit
+        self.size = size
+        self.scale = size / (PressureLUT.VMAX - PressureLUT.VMIN)
+        grid = np.linspace(PressureLUT.VMIN, PressureLUT.VMAX, size + 1)
+        self.table = np.stack([calibration.pressure(grid, unit) for calibration in calibrations])
+        self.slope = np.diff(self.table, axis=1, append=self.table[:, -1:])
+
+        # Channels are laid out back to back so one flat gather serves every channel
+        self.flatTable = self.table.ravel()
+        self.flatSlope = self.slope.ravel()
+        self.offsets = (np.arange(len(self.table)) * (size + 1))[:, None]
+
+    def convert(self, voltages):
+        # voltages is (channels,) or (channels, samples); out of range voltages are clamped
+        voltages = np.asarray(voltages, dtype=np.float64)
+        shape = voltages.shape
+        x = (voltages.reshape(len(self.table), -1) - PressureLUT.VMIN) * self.scale
+        np.clip(x, 0, self.size, out=x)
+        index = x.astype(np.intp)
+        x -= index
+        index += self.offsets
+        pressures = self.flatSlope.take(index)
+        pressures *= x
+        pressures += self.flatTable.take(index)
+        return pressures.reshape(shape)
+
+
+class CalibrationStore:
+    # Calibrations are kept per gauge serial, so a gauge keeps its correction when it
+    # is moved to another input
+
+    def __init__(self, path=CALIBRATION_FILE):
+        self.path = path
+        self.gauges = {}
+        try:
+            with open(path) as file:
+                self.gauges = {serial: GaugeCalibration.fromDict(serial, data) for serial, data in json.load(file).items()}
+        except (OSError, ValueError):
+            pass
+
+    def get(self, serial):
+        if serial and serial in self.gauges:
+            return self.gauges[serial]
+        return GaugeCalibration(serial)
+
+    def set(self, calibration):
+        if calibration.serial:
+            self.gauges[calibration.serial] = calibration
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as file:
+            json.dump({serial: calibration.toDict() for serial, calibration in self.gauges.items()}, file, indent=4)
+
+    def compile(self, serials, unit="mbar"):
+        return PressureLUT([self.get(serial) for serial in serials], unit)
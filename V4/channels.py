@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+
+# How each sensor's analog input is set up, one entry per sensor (AI0, AI1, ...) in the
+# "channels" settings, e.g. {"physical": "ai0", "terminal": "RSE", "min": 0.0, "max": 10.0}.
+# terminal is a TerminalConfiguration name (DEFAULT, RSE, NRSE, DIFF, PSEUDO_DIFF).
+# min and max are the input voltages expected at the terminals; the driver uses the
+# narrowest range of the device that holds them, so a tighter span gives more ADC codes
+# per volt. scale [slope, intercept] maps terminal volts to gauge volts, e.g. [2.0, 0.0]
+# behind a 2:1 divider; the samples then arrive in gauge volts. Kept free of nidaqmx so
+# settings can be checked without the driver.
+
+ChannelConfig = namedtuple("ChannelConfig", ["physical", "terminal", "minVoltage", "maxVoltage", "scale"])
+
+TERMINAL_CONFIGS = ["DEFAULT", "RSE", "NRSE", "DIFF", "PSEUDO_DIFF"]
+# FRG-700/702 output span, the error levels near 0 V and 10 V included
+GAUGE_MIN = 0.0
+GAUGE_MAX = 10.0
+# Inputs per bank of differential pairs on multiplexed devices
+DIFF_BANK = 16
+
+
+def channelsFromSettings(settings, nr_channels):
+    settings = list(settings) + [{}] * (nr_channels - len(settings))
+    channels = []
+    for i, channel in enumerate(settings[:nr_channels]):
+        scale = channel.get("scale")
+        channels.append(ChannelConfig(channel.get("physical", f"ai{i}"), channel.get("terminal", "DEFAULT"),
+                                      float(channel.get("min", GAUGE_MIN)), float(channel.get("max", GAUGE_MAX)),
+                                      (float(scale[0]), float(scale[1])) if scale else None))
+    return channels
+
+
+def scaledLimits(channel):
+    # min and max in the units the samples arrive in
+    if channel.scale is None:
+        return channel.minVoltage, channel.maxVoltage
+    slope, intercept = channel.scale
+    limits = sorted([slope * channel.minVoltage + intercept, slope * channel.maxVoltage + intercept])
+    return limits[0], limits[1]
+
+
+def inputRange(channel, voltageRanges):
+    # Narrowest device range holding min..max, None when none does
+    ranges = [(low, high) for low, high in voltageRanges if low <= channel.minVoltage and channel.maxVoltage <= high]
+    return min(ranges, key=lambda r: r[1] - r[0]) if ranges else None
+
+
+def validateChannels(channels, info):
+    # Problems with the channel settings on this device, as messages; empty when they are
+    # fine. Checks what the cached DeviceInfo knows and skips what it does not.
+    problems = []
+    prefix = info.name + "/"
+    used = {}
+    for i, channel in enumerate(channels):
+        physical = prefix + channel.physical
+        if physical in used:
+            problems.append(f"AI{i}: {channel.physical} is already used by AI{used[physical]}")
+        used[physical] = i
+        if channel.terminal not in TERMINAL_CONFIGS:
+            problems.append(f"AI{i}: unknown terminal configuration {channel.terminal}")
+        if channel.minVoltage >= channel.maxVoltage:
+            problems.append(f"AI{i}: min {channel.minVoltage} V is not below max {channel.maxVoltage} V")
+        if channel.scale is not None and channel.scale[0] == 0:
+            problems.append(f"AI{i}: the scale slope cannot be 0")
+
+        if info.aiChannels is not None:
+            if physical not in info.aiChannels:
+                problems.append(f"AI{i}: {info.name} has no input {channel.physical}")
+            elif channel.terminal == "DIFF" and not info.simultaneous and len(info.aiChannels) % 2 == 0:
+                # Multiplexed NI devices pair inputs within banks of up to 16, aiN with
+                # aiN+8 (ai0/ai8, ai16/ai24), or aiN with aiN+half on smaller devices.
+                # Simultaneous devices have a separate pair per channel.
+                index = info.aiChannels.index(physical)
+                half = min(len(info.aiChannels), DIFF_BANK) // 2
+                if index % (2 * half) >= half:
+                    problems.append(f"AI{i}: {channel.physical} is the negative input of a differential pair")
+                elif any(prefix + c.physical == info.aiChannels[index + half] for c in channels):
+                    problems.append(f"AI{i}: differential {channel.physical} needs {info.aiChannels[index + half]} as its negative input")
+        if info.terminalConfigs is not None and channel.terminal != "DEFAULT" and channel.terminal not in info.terminalConfigs:
+            problems.append(f"AI{i}: {info.name} does not support {channel.terminal} (supports {', '.join(info.terminalConfigs)})")
+        if info.voltageRanges and inputRange(channel, info.voltageRanges) is None:
+            ranges = ", ".join(f"{low:g} to {high:g} V" for low, high in info.voltageRanges)
+            problems.append(f"AI{i}: {channel.minVoltage:g} to {channel.maxVoltage:g} V fits no input range of {info.name} ({ranges})")
+    return problems
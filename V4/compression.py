@@ -0,0 +1,160 @@
+from collections import deque
+import numpy as np
+
+
+# Recorders that decide, block by block, which readings go into the run log. They work
+# on log10 of the pressure, so the tolerance is in decades (0.01 is about 2.3 %) and
+# means the same at 1e-8 and at 1000 mbar. All sensors share one timeline: a row is
+# stored for every sensor whenever one of them needs a point. A change of sensor status
+# (including a reading becoming invalid) always stores the readings on both sides of
+# the change, and maxInterval (seconds) bounds the time between stored rows.
+# add() returns the rows to store as (timestamp, pressures, status) tuples, flush()
+# returns the last reading if it has not been stored yet, e.g. when the run stops.
+
+def logPressure(pressures):
+    pressures = np.asarray(pressures, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(pressures > 0, np.log10(pressures), np.nan)
+
+
+class Point:
+    __slots__ = ("t", "pressures", "status", "y", "valid")
+
+    def __init__(self, t, pressures, status):
+        self.t = t
+        self.pressures = np.array(pressures, dtype=np.float64)
+        self.status = np.array(status, dtype=np.uint8)
+        self.y = logPressure(self.pressures)
+        self.valid = np.isfinite(self.y)
+
+    def row(self):
+        return self.t, self.pressures, self.status
+
+    def changedFrom(self, other):
+        return bool(np.any(self.status != other.status) or np.any(self.valid != other.valid))
+
+
+class DeadbandRecorder:
+    # Stores a reading when any sensor has moved more than the tolerance from its last
+    # stored value. Reconstruct by holding each stored value until the next one.
+
+    def __init__(self, nr_sensors, tolerance=0.01, maxInterval=None):
+        self.nr_sensors = nr_sensors
+        self.tolerance = tolerance
+        self.maxInterval = maxInterval
+        self.archive = None
+        self.previous = None
+
+    def add(self, t, pressures, status):
+        point = Point(t, pressures, status)
+        rows = []
+        if self.archive is not None and point.changedFrom(self.archive) and self.previous is not None:
+            rows.append(self.previous.row())
+        if self.archive is None or self.outside(point):
+            rows.append(point.row())
+            self.archive = point
+            self.previous = None
+        else:
+            self.previous = point
+        return rows
+
+    def outside(self, point):
+        if point.changedFrom(self.archive):
+            return True
+        if self.maxInterval is not None and point.t - self.archive.t >= self.maxInterval:
+            return True
+        return bool(np.any(np.abs(point.y - self.archive.y)[point.valid] > self.tolerance))
+
+    def flush(self):
+        rows = [self.previous.row()] if self.previous is not None else []
+        if self.previous is not None:
+            self.archive = self.previous
+            self.previous = None
+        return rows
+
+
+class SwingingDoorRecorder:
+    # Swinging door trending per sensor. From the last stored reading (the pivot), every
+    # later reading narrows the range of slopes (the door) a straight line from the pivot
+    # may take to stay within the tolerance of all of them. A reading whose own slope is
+    # still inside the door left by the readings before it can end a segment. Once the
+    # door closes, the last such reading is stored as the new pivot and the readings
+    # after it are taken again from there. Reconstruct by linear interpolation between
+    # stored rows; every skipped reading is within the tolerance.
+
+    def __init__(self, nr_sensors, tolerance=0.01, maxInterval=None):
+        self.nr_sensors = nr_sensors
+        self.tolerance = tolerance
+        self.maxInterval = maxInterval
+        self.archive = None
+        self.candidate = None
+        self.pending = []
+        self.upper = np.full(nr_sensors, np.inf)
+        self.lower = np.full(nr_sensors, -np.inf)
+
+    def add(self, t, pressures, status):
+        rows = []
+        work = deque([Point(t, pressures, status)])
+        while work:
+            point = work.popleft()
+            if self.archive is None:
+                rows.append(self.store(point))
+                continue
+
+            slope, upper, lower = self.door(point)
+            if point.changedFrom(self.archive) or lower is None or np.any((lower > upper)[point.valid]) or \
+                    (self.maxInterval is not None and point.t - self.archive.t >= self.maxInterval):
+                if self.candidate is None:
+                    rows.append(self.store(point))
+                else:
+                    work.extendleft(reversed(self.pending + [point]))
+                    rows.append(self.store(self.candidate))
+                continue
+
+            inside = ((slope >= self.lower) & (slope <= self.upper))[point.valid]
+            self.upper, self.lower = upper, lower
+            if np.all(inside):
+                self.candidate = point
+                self.pending = []
+            else:
+                self.pending.append(point)
+        return rows
+
+    def door(self, point):
+        dt = point.t - self.archive.t
+        if dt <= 0:
+            return None, None, None
+        with np.errstate(invalid="ignore"):
+            slope = (point.y - self.archive.y) / dt
+            upper = np.fmin(self.upper, slope + self.tolerance / dt)
+            lower = np.fmax(self.lower, slope - self.tolerance / dt)
+        return slope, upper, lower
+
+    def store(self, point):
+        self.archive = point
+        self.candidate = None
+        self.pending = []
+        self.upper = np.full(self.nr_sensors, np.inf)
+        self.lower = np.full(self.nr_sensors, -np.inf)
+        return point.row()
+
+    def flush(self):
+        # Ends with the last reading stored, keeping every skipped one within tolerance
+        rows = []
+        while self.candidate is not None:
+            pending = self.pending
+            rows.append(self.store(self.candidate))
+            for point in pending:
+                rows += self.add(*point.row())
+        return rows
+
+
+RECORDERS = {"deadband": DeadbandRecorder, "swinging_door": SwingingDoorRecorder}
+
+
+def recorderFromSettings(settings, nr_sensors):
+    # None for the plain fixed interval recording
+    recorder = RECORDERS.get(settings.get("mode"))
+    if recorder is None:
+        return None
+    return recorder(nr_sensors, settings.get("tolerance_decades", 0.01), settings.get("max_interval"))
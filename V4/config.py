@@ -0,0 +1,73 @@
+import copy
+import json
+import os
+
+
+# Settings live in the user's home so they survive the one-file PyInstaller build
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".pressure_reader")
+SETTINGS_FILE = os.path.join(CONFIG_DIR, "settings.json")
+
+DEFAULTS = {
+    # Serial number of the gauge on each input (AI0, AI1, ...), used to pick its calibration
+    "gauges": [],
+    # Input of each sensor, e.g. {"physical": "ai0", "terminal": "RSE", "min": 0.0, "max": 10.0}, see channels.py
+    "channels": [],
+    # Mains notch and decimating low-pass applied to every block before it is reduced
+    "filter": {"enabled": True, "output_rate": 100.0, "mains": [50.0, 60.0], "notch_q": 30.0},
+    # Seconds between scans for NI-DAQmx devices being plugged in or removed
+    "devices": {"poll_interval": 2.0},
+    # Blocks the acquisition process can be ahead of the GUI before the GUI skips blocks, seconds
+    # of samples the DAQmx buffer holds, and whether Start switches to a proposed sampling
+    # rate without asking when the device cannot run the entered one (see planner.py)
+    "acquisition": {"ring_blocks": 16, "buffer_seconds": 10.0, "auto_plan": False},
+    # Worker processes for heavy per block analysis such as the spectrum, 0 runs it in the reader thread
+    "analysis": {"processes": 2},
+    # Target pressure (mbar) for the pump-down prediction in the graph window
+    "prediction": {"target_mbar": 1e-6},
+    # Live readings over TCP for other programs, see server.py for the frame format
+    "server": {"enabled": False, "host": "127.0.0.1", "port": 5025, "queue": 64},
+    # Level for the log file in ~/.pressure_reader/logs; each message is limited to burst per interval seconds
+    "logging": {"level": "INFO", "file_bytes": 1000000, "backups": 5, "burst": 5, "interval": 10.0},
+    # Shared memory segment with the latest pressures for other local programs, layout in livefeed.py
+    "feed": {"enabled": False, "name": "pressure_reader_live", "history": 600},
+    # Raw blocks around a trigger, saved to ~/.pressure_reader/captures; conditions are described in trigger.py
+    "capture": {"enabled": False, "pre_seconds": 2.0, "post_seconds": 2.0, "holdoff": 10.0, "conditions": []},
+    # Every block in an SQLite database with 1 s, 1 min and 1 h rollups, kept for retention_days (null keeps all), see history.py
+    "history": {"enabled": False, "path": None, "batch_seconds": 1.0,
+                "retention_days": {"raw": 7, "1s": 30, "1m": 730, "1h": None}},
+    # Which readings go into the run log: "interval" keeps one every data record interval,
+    # "deadband" and "swinging_door" keep only what is needed to stay within tolerance_decades
+    # of log10(pressure), with at least one row every max_interval seconds (see compression.py)
+    "recording": {"mode": "interval", "tolerance_decades": 0.01, "max_interval": 600},
+    # Prometheus text format at http://host:port/metrics
+    "metrics": {"enabled": False, "host": "127.0.0.1", "port": 9108},
+    # Thresholds are in mbar, rise is in decades per second, one entry per sensor
+    "alarms": {"hysteresis": 0.05, "debounce": 1, "sensors": []},
+    # Output driven when a condition such as {"sensor": 0, "above": 1e-2} holds (mbar).
+    # backend is digital, analog or simulated, channel is relative to the acquiring device
+    "interlock": {"enabled": False, "backend": "digital", "channel": "port0/line0", "active_high": True,
+                  "trip_voltage": 5.0, "idle_voltage": 0.0, "latch": True, "trip_on_invalid": True,
+                  "conditions": []},
+}
+
+
+def loadSettings():
+    settings = copy.deepcopy(DEFAULTS)
+    try:
+        with open(SETTINGS_FILE) as file:
+            stored = json.load(file)
+    except (OSError, ValueError):
+        return settings
+
+    for key, value in stored.items():
+        if isinstance(value, dict) and isinstance(settings.get(key), dict):
+            settings[key].update(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+def saveSettings(settings):
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    with open(SETTINGS_FILE, "w") as file:
+        json.dump(settings, file, indent=4)
@@ -0,0 +1,112 @@
+import logging
+import nidaqmx
+from nidaqmx.constants import AcquisitionType, TerminalConfiguration, VoltageUnits
+from nidaqmx.scale import Scale
+from nidaqmx.stream_readers import AnalogMultiChannelReader
+from nidaqmx.system import System, Device
+import numpy as np
+from discovery import DeviceInfo
+from channels import scaledLimits
+
+
+# Everything that needs the NI-DAQmx driver. Importing nidaqmx takes a noticeable part
+# of a second, so it is only imported by device discovery and the acquisition process.
+
+log = logging.getLogger(__name__)
+
+DaqError = nidaqmx.errors.DaqError
+# Raised when the nidaqmx package is installed but the NI-DAQmx runtime is not
+DaqNotFoundError = nidaqmx.errors.DaqNotFoundError
+
+
+def listDevices():
+    return [device.name for device in System.local().devices]
+
+
+def deviceInfo(name):
+    device = Device(name)
+    aiChannels = device.ai_physical_chans
+    ranges = device.ai_voltage_rngs
+    terminalConfigs = [config.name for config in aiChannels[0].ai_term_cfgs] if len(aiChannels) else []
+    onboardBuffer, usbTransferBytes = bufferSizes(aiChannels[0].name) if len(aiChannels) else (None, None)
+    return DeviceInfo(name, device.product_type, device.dev_serial_num, device.dev_is_simulated,
+                      [channel.name for channel in aiChannels], device.ai_max_multi_chan_rate, device.ai_max_single_chan_rate,
+                      list(zip(ranges[::2], ranges[1::2])), terminalConfigs,
+                      [channel.name for channel in device.ao_physical_chans], [line.name for line in device.do_lines],
+                      device.ai_min_rate, device.ai_simultaneous_sampling_supported, onboardBuffer, usbTransferBytes)
+
+
+def bufferSizes(channel):
+    # The FIFO and USB transfer sizes are task properties, so they are read from a task
+    # that is never started and reserves nothing; either is None when not applicable
+    with nidaqmx.Task() as task:
+        task.ai_channels.add_ai_voltage_chan(channel)
+        try:
+            onboardBuffer = task.in_stream.input_onbrd_buf_size
+        except nidaqmx.errors.DaqError:
+            onboardBuffer = None
+        try:
+            usbTransferBytes = task.ai_channels[0].ai_usb_xfer_req_size
+        except nidaqmx.errors.DaqError:
+            usbTransferBytes = None
+    return onboardBuffer, usbTransferBytes
+
+
+class AnalogInStream(nidaqmx.Task):
+
+    def __init__(self, deviceID, nr_samples, channels):
+        # channels is a ChannelConfig per sensor, in sensor order
+        super().__init__()
+        for i, channel in enumerate(channels):
+            minVal, maxVal = scaledLimits(channel)
+            options = {}
+            if channel.scale is not None:
+                # Scales live as long as the process, which is one acquisition run
+                name = f"PressureReaderAI{i}"
+                Scale.create_lin_scale(name, channel.scale[0], channel.scale[1], scaled_units="V")
+                options = {"units": VoltageUnits.FROM_CUSTOM_SCALE, "custom_scale_name": name}
+            self.ai_channels.add_ai_voltage_chan(f"{deviceID}/{channel.physical}", terminal_config=TerminalConfiguration[channel.terminal],
+                                                 min_val=minVal, max_val=maxVal, **options)
+        self.reader = AnalogMultiChannelReader(self.in_stream)
+
+        self.nr_channels = len(channels)
+        self.nr_samples = int(nr_samples)
+
+        # Creating the buffer
+        self.acq_data = np.zeros((self.nr_channels, self.nr_samples), dtype=np.float64)
+        # Samples per channel that were waiting in the device buffer before the last read
+        self.lastAvailable = 0
+
+    def configureClock(self, sample_rate, bufferSamples=None):
+        # bufferSamples per channel for the host buffer, from the acquisition plan
+        try:
+            self.timing.cfg_samp_clk_timing(int(sample_rate), sample_mode=AcquisitionType.CONTINUOUS,
+                                            samps_per_chan=int(bufferSamples or self.nr_samples * 50))
+        except NameError:
+            log.error("Name Error while configuring the sample clock")
+
+    def acquire_data(self, out=None):
+        # Reads into `out` (channels x samples, C contiguous float64) when given
+        log.debug("Acquire Data")
+        data = self.acq_data if out is None else out
+
+        try:
+            if self.reader is not None:
+                self.lastAvailable = self.in_stream.avail_samp_per_chan
+                self.reader.read_many_sample(data, number_of_samples_per_channel=self.nr_samples)
+        except nidaqmx.errors.DaqError as e:
+            raise RuntimeError("Failed to acquire data: " + str(e))
+
+        return data
+
+    def close_task(self):
+        log.debug("Closing Task")
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close_task()
+        if exc_type is not None:
+            raise
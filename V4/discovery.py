@@ -0,0 +1,94 @@
+from collections import namedtuple
+import logging
+import threading
+
+
+# What a device can do, read once per device and cached. Rates are in S/s, voltage
+# ranges are (min, max) pairs and channel names are full physical names (Dev1/ai0).
+# onboardBuffer is the analog input FIFO in samples and usbTransferBytes the size of
+# one USB transfer request, None for devices without them. Fields are None when the
+# driver could not report them.
+DeviceInfo = namedtuple("DeviceInfo", ["name", "product", "serial", "simulated", "aiChannels", "maxMultiRate", "maxSingleRate",
+                                       "voltageRanges", "terminalConfigs", "aoChannels", "doLines", "minRate", "simultaneous",
+                                       "onboardBuffer", "usbTransferBytes"], defaults=[None] * 4)
+
+log = logging.getLogger(__name__)
+
+
+class DeviceDiscovery:
+    # Enumerates NI-DAQmx devices on a background thread and polls for devices being
+    # plugged in or removed. The listener is called from that thread, with the current
+    # list of DeviceInfo, whenever the list changes; the first scan always reports.
+    # Capabilities are only queried for devices not seen before, and a device whose
+    # capabilities could not be read is listed by name and queried again next poll.
+
+    def __init__(self, listener, interval=2.0):
+        self.listener = listener
+        self.interval = interval
+        self.cache = {}
+        self.current = None
+        self.thread = None
+        self.wake = threading.Event()
+        self.stopping = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="DeviceDiscovery", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(5)
+
+    def refresh(self):
+        # Scan now instead of at the next poll
+        self.wake.set()
+
+    def devices(self):
+        return list(self.current or [])
+
+    def run(self):
+        # nidaqmx is imported here so loading the driver never blocks the GUI thread
+        try:
+            import daq
+        except Exception:
+            log.exception("NI-DAQmx could not be loaded, no devices will be listed")
+            self.listener([])
+            return
+
+        failure = None
+        while not self.stopping:
+            try:
+                self.scan(daq.listDevices(), daq.deviceInfo)
+                failure = None
+            except daq.DaqNotFoundError as e:
+                # The runtime does not appear while the program runs, so stop polling
+                log.warning("NI-DAQmx runtime not found, no devices will be listed: %s", e)
+                self.scan([], None)
+                return
+            except Exception as e:
+                # A failure that repeats every poll is only logged when it first occurs
+                if repr(e) != failure:
+                    failure = repr(e)
+                    log.warning("Device enumeration failed: %s", e)
+                self.scan([], None)
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def scan(self, names, describe):
+        for name in list(self.cache):
+            if name not in names:
+                del self.cache[name]
+        for name in names:
+            if name not in self.cache:
+                try:
+                    self.cache[name] = describe(name)
+                    log.info("Found %s", self.cache[name])
+                except Exception as e:
+                    log.debug("Capabilities of %s could not be read: %s", name, e)
+
+        devices = [self.cache.get(name) or DeviceInfo(name, *[None] * (len(DeviceInfo._fields) - 1)) for name in names]
+        if devices != self.current:
+            self.current = devices
+            self.listener(devices)
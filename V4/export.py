@@ -0,0 +1,81 @@
+import os
+import status as sensorstatus
+from pressurelog import PressureLog
+
+
+# Export of a run log, shared by the Export button and bench_export.py. The format
+# follows the file extension; .xlsx, .csv and .parquet hold the same table (time,
+# timestamp, then pressure and status per sensor), .frglog is the native log.
+# pandas is only imported when a table is written, parquet also needs pyarrow.
+
+# Excel's row limit, less the header row
+XLSX_MAX_ROWS = 1048575
+
+
+def table(log, unit=None):
+    import pandas as pd
+    unit = unit or log.unit
+    t, pressure, status = log.read(unit=unit)
+    data = {"Time (min)": log.elapsedMinutes(t), "Timestamp (UTC)": pd.to_datetime(t, unit="s")}
+    for i in range(log.nr_sensors):
+        data[f"Pressure Sensor AI{i}({unit})"] = pressure[:, i]
+        # Categorical keeps one small code per row instead of a string object
+        data[f"Status Sensor AI{i}"] = pd.Categorical.from_codes(status[:, i], sensorstatus.NAMES)
+    return pd.DataFrame(data)
+
+
+def exportExcel(log, path, unit=None):
+    if len(log) > XLSX_MAX_ROWS:
+        raise ValueError(f"{len(log)} rows do not fit in an Excel sheet ({XLSX_MAX_ROWS} at most), use CSV, Parquet or Pressure Log")
+    table(log, unit).to_excel(path, index=False)
+
+
+def exportCsv(log, path, unit=None):
+    table(log, unit).to_csv(path, index=False)
+
+
+def exportParquet(log, path, unit=None):
+    table(log, unit).to_parquet(path, index=False)
+
+
+def exportNative(log, path, unit=None):
+    # Always in the log's own unit, which the file records
+    log.save(path)
+
+
+def loadExcel(path):
+    import pandas as pd
+    return pd.read_excel(path)
+
+
+def loadCsv(path):
+    import pandas as pd
+    return pd.read_csv(path)
+
+
+def loadParquet(path):
+    import pandas as pd
+    return pd.read_parquet(path)
+
+
+def loadNative(path):
+    return PressureLog.open(path).read()
+
+
+# extension -> (writer, reader)
+FORMATS = {
+    ".xlsx": (exportExcel, loadExcel),
+    ".csv": (exportCsv, loadCsv),
+    ".parquet": (exportParquet, loadParquet),
+    ".frglog": (exportNative, loadNative),
+}
+
+
+def exportLog(log, path, unit=None):
+    # Returns the path written; without a known extension it is an Excel file and gets .xlsx
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        extension = ".xlsx"
+        path += extension
+    FORMATS[extension][0](log, path, unit)
+    return path
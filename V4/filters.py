@@ -0,0 +1,97 @@
+import numpy as np
+from scipy import signal
+
+
+def decimationStages(factor, largest=10):
+    # Splits the total decimation into stages of at most `largest`, e.g. 400 -> 10, 10, 4
+    stages = []
+    while factor > 1:
+        for q in range(min(largest, factor), 1, -1):
+            if factor % q == 0:
+                stages.append(q)
+                factor //= q
+                break
+        else:
+            # Prime factor above `largest`, take it in one stage
+            stages.append(factor)
+            factor = 1
+    return stages
+
+
+class SectionStage:
+    # One cascade of second order sections with its state per channel, optionally
+    # keeping every q-th output sample. The state and the decimation phase carry over
+    # between blocks, so consecutive blocks filter like one continuous signal.
+
+    def __init__(self, sos, nr_channels, q=1):
+        self.sos = sos
+        self.q = q
+        self.nr_channels = nr_channels
+        self.zi = None
+        self.phase = 0
+
+    def process(self, block):
+        if self.zi is None:
+            # Start from steady state at the first sample to avoid a start up transient
+            self.zi = signal.sosfilt_zi(self.sos)[:, None, :] * block[None, :, :1]
+        filtered, self.zi = signal.sosfilt(self.sos, block, axis=1, zi=self.zi)
+        if self.q == 1:
+            return filtered
+
+        output = filtered[:, self.phase::self.q]
+        self.phase = (self.phase - block.shape[1]) % self.q
+        return output
+
+
+class StreamingFilter:
+    # Mains notch plus decimating low-pass, e.g. 40 kHz -> 100 Hz. Each decimation stage
+    # is an 8th order Chebyshev type I low-pass at 80% of the new Nyquist frequency, the
+    # same anti-aliasing filter scipy.signal.decimate uses. Notches run at the lowest
+    # intermediate rate that still resolves them, where they are cheapest and best
+    # conditioned.
+
+    def __init__(self, nr_channels, sampleRate, outputRate=100.0, mains=(50.0, 60.0), notchQ=30.0):
+        factor = max(1, int(round(sampleRate / outputRate)))
+        self.sampleRate = sampleRate
+        self.outputRate = sampleRate / factor
+        self.stages = []
+
+        rate = sampleRate
+        notches = [f for f in mains if f < self.outputRate / 2]
+        pending = [f for f in mains if f not in notches]
+        for q in decimationStages(factor):
+            # Insert the remaining notches before the stage that would alias them away
+            if pending and rate / q < 2.5 * max(pending):
+                self.addNotches(pending, rate, notchQ, nr_channels)
+                pending = []
+            sos = signal.cheby1(8, 0.05, 0.8 / q, output="sos")
+            self.stages.append(SectionStage(sos, nr_channels, q))
+            rate /= q
+        notches += pending
+        if notches:
+            self.addNotches(notches, rate, notchQ, nr_channels)
+
+    def addNotches(self, frequencies, rate, q, nr_channels):
+        stage = self.notchStage(frequencies, rate, q, nr_channels)
+        if stage is not None:
+            self.stages.append(stage)
+
+    @staticmethod
+    def notchStage(frequencies, rate, q, nr_channels):
+        # None when every frequency is at or above the Nyquist frequency of this rate
+        sections = [signal.tf2sos(*signal.iirnotch(f, q, fs=rate)) for f in frequencies if f < rate / 2]
+        if not sections:
+            return None
+        return SectionStage(np.concatenate(sections), nr_channels)
+
+    def process(self, block):
+        for stage in self.stages:
+            block = stage.process(block)
+        return block
+
+    @classmethod
+    def fromSettings(cls, nr_channels, sampleRate, settings):
+        if not settings.get("enabled", True) or sampleRate <= settings.get("output_rate", 100.0):
+            return None
+        return cls(nr_channels, sampleRate, settings.get("output_rate", 100.0),
+                   settings.get("mains", [50.0, 60.0]), settings.get("notch_q", 30.0))
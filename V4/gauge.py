@@ -0,0 +1,20 @@
+import numpy as np
+
+
+# FRG-700/702 output law: p = 10 ** (1.667 * U - d), with d depending on the unit
+UNITS = ["mbar", "torr", "pascal"]
+D = {"mbar": 11.33, "torr": 11.46, "pascal": 9.333}
+SLOPE = 1.667
+
+
+def voltageToPressure(voltage, unit="mbar"):
+    return np.power(10.0, SLOPE * np.asarray(voltage, dtype=np.float64) - D[unit])
+
+
+def pressureToVoltage(pressure, unit="mbar"):
+    return (np.log10(pressure) + D[unit]) / SLOPE
+
+
+def convertPressure(pressure, fromUnit, toUnit):
+    # Uses the same constants as the gauge law so converted thresholds line up exactly
+    return np.asarray(pressure, dtype=np.float64) * 10.0 ** (D[fromUnit] - D[toUnit])
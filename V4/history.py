@@ -0,0 +1,214 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import numpy as np
+from config import CONFIG_DIR
+from gauge import convertPressure
+from metrics import REGISTRY
+
+
+# Every block's pressures, kept across runs in an SQLite database in WAL mode
+# (~/.pressure_reader/history.sqlite by default). Blocks go into the raw table, and the
+# same transaction adds them to rollup tables at 1 s, 1 min and 1 h (sum, min, max and
+# count of the valid readings per sensor and bucket). A crash loses at most the last
+# uncommitted batch, and the rollups always agree with what was committed. Pressures
+# are stored in mbar, sensors by position (0 = the first sensor, on whichever input
+# its "channels" entry names). A reading already stored for the same sensor and time,
+# e.g. after the clock stepped back, is kept and the repeat is left out of the raw
+# table and the rollups alike. Rows older than a level's
+# retention are deleted every few minutes. The writer thread owns the connection; the
+# acquisition only puts blocks on a queue. HistoryReader picks the level for a query.
+
+log = logging.getLogger(__name__)
+
+HISTORY_FILE = os.path.join(CONFIG_DIR, "history.sqlite")
+# Rollup tables and their bucket length in seconds
+LEVELS = {"1s": 1, "1m": 60, "1h": 3600}
+PRUNE_INTERVAL = 300
+
+HISTORY_DROPPED = REGISTRY.counter("history_dropped_blocks", "Blocks not stored because the history writer fell behind")
+HISTORY_COMMIT_SECONDS = REGISTRY.histogram("history_commit_seconds", "Time per history write transaction")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS raw (sensor INTEGER NOT NULL, t REAL NOT NULL, pressure REAL, status INTEGER NOT NULL,"
+    " PRIMARY KEY (sensor, t)) WITHOUT ROWID",
+] + [
+    f"CREATE TABLE IF NOT EXISTS rollup_{level} (sensor INTEGER NOT NULL, t REAL NOT NULL, sum REAL NOT NULL,"
+    f" min REAL NOT NULL, max REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (sensor, t)) WITHOUT ROWID"
+    for level in LEVELS
+]
+
+
+def connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    return connection
+
+
+def rollup(t, pressures, seconds):
+    # Rows (sensor, bucket, sum, min, max, count) for one batch; t is sorted
+    buckets = np.floor(t / seconds) * seconds
+    rows = []
+    for sensor in range(pressures.shape[1]):
+        valid = np.isfinite(pressures[:, sensor])
+        if not valid.any():
+            continue
+        b, p = buckets[valid], pressures[valid, sensor]
+        starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+        counts = np.diff(np.r_[starts, len(b)])
+        rows += zip([sensor] * len(starts), b[starts].tolist(), np.add.reduceat(p, starts).tolist(),
+                    np.minimum.reduceat(p, starts).tolist(), np.maximum.reduceat(p, starts).tolist(), counts.tolist())
+    return rows
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_FILE, retention=None, batchSeconds=1.0, queueSize=10000):
+        # retention maps "raw" and the level names to days, None keeps everything
+        self.path = path
+        self.retention = retention or {}
+        self.batchSeconds = batchSeconds
+        self.queue = queue.Queue(queueSize)
+        self.thread = None
+        self.lastPrune = 0.0
+
+    @classmethod
+    def fromSettings(cls, settings):
+        if not settings.get("enabled"):
+            return None
+        return cls(settings.get("path") or HISTORY_FILE, settings.get("retention_days"), settings.get("batch_seconds", 1.0))
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = connect(self.path)
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+        self.thread = threading.Thread(target=self.run, args=(connection,), name="HistoryWriter", daemon=True)
+        self.thread.start()
+
+    def add(self, timestamp, pressures, status, unit="mbar"):
+        # Called for every block, never blocks the caller
+        try:
+            self.queue.put_nowait((timestamp, convertPressure(pressures, unit, "mbar"), np.array(status, dtype=np.uint8)))
+        except queue.Full:
+            HISTORY_DROPPED.inc()
+
+    def run(self, connection):
+        running = True
+        while running:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.batchSeconds))
+                deadline = time.monotonic() + self.batchSeconds
+                while len(batch) < self.queue.maxsize:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                running = False
+            try:
+                if batch:
+                    self.write(connection, batch)
+                if time.monotonic() - self.lastPrune > PRUNE_INTERVAL or not running:
+                    self.prune(connection)
+            except sqlite3.Error:
+                log.exception("History could not be written")
+        connection.close()
+
+    def write(self, connection, batch):
+        start = time.perf_counter()
+        batch.sort(key=lambda item: item[0])
+        t = np.array([item[0] for item in batch])
+        pressures = np.array([item[1] for item in batch], dtype=np.float64).reshape(len(batch), -1)
+        status = np.array([item[2] for item in batch], dtype=np.uint8).reshape(len(batch), -1)
+        # The first reading of a repeated time wins, within the batch and against the database
+        t, first = np.unique(t, return_index=True)
+        pressures, status = pressures[first], status[first]
+        new = np.ones(pressures.shape, dtype=bool)
+        for sensor in range(pressures.shape[1]):
+            stored = connection.execute("SELECT t FROM raw WHERE sensor = ? AND t >= ? AND t <= ?",
+                                        (sensor, float(t[0]), float(t[-1]))).fetchall()
+            if stored:
+                new[:, sensor] = ~np.isin(t, [row[0] for row in stored])
+        # NaN becomes NULL, the reading was not valid
+        stored = np.where(np.isfinite(pressures), pressures, None)
+        raw = [(sensor, float(t[i]), stored[i, sensor], int(status[i, sensor]))
+               for i in range(len(t)) for sensor in range(pressures.shape[1]) if new[i, sensor]]
+        # Repeats count nowhere in the rollups, which skip NaN
+        pressures = np.where(new, pressures, np.nan)
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO raw VALUES (?, ?, ?, ?)", raw)
+            for level, seconds in LEVELS.items():
+                connection.executemany(
+                    f"INSERT INTO rollup_{level} VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (sensor, t) DO UPDATE SET"
+                    " sum = sum + excluded.sum, min = min(min, excluded.min), max = max(max, excluded.max),"
+                    " count = count + excluded.count", rollup(t, pressures, seconds))
+        HISTORY_COMMIT_SECONDS.observe(time.perf_counter() - start)
+
+    def prune(self, connection):
+        self.lastPrune = time.monotonic()
+        now = time.time()
+        with connection:
+            for level in ["raw"] + list(LEVELS):
+                days = self.retention.get(level)
+                if days is not None:
+                    table = level if level == "raw" else f"rollup_{level}"
+                    # Per sensor, so the delete walks the primary key instead of the table
+                    sensors = connection.execute(f"SELECT max(sensor) FROM {table}").fetchone()[0]
+                    for sensor in range(sensors + 1 if sensors is not None else 0):
+                        connection.execute(f"DELETE FROM {table} WHERE sensor = ? AND t < ?", (sensor, now - days * 86400))
+
+    def stop(self):
+        # Writes what is queued, then closes the database
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class HistoryReader:
+    # e.g. t, mean, low, high, count = HistoryReader().query(0, time.time() - 30 * 86400, time.time())
+
+    def __init__(self, path=HISTORY_FILE):
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def level(self, sensor, start, end, maxPoints, rawInterval):
+        # Finest level that returns at most about maxPoints rows and still reaches back
+        # to start, or to the beginning of the history (within an hour) if that is later
+        levels = [("raw", rawInterval)] + list(LEVELS.items())
+        candidates = [name for name, seconds in levels if (end - start) / seconds <= maxPoints] or [levels[-1][0]]
+        first = self.oldest(levels[-1][0], sensor)
+        begin = max(start, first if first is not None else start) + levels[-1][1]
+        for name in candidates:
+            oldest = self.oldest(name, sensor)
+            if oldest is not None and oldest <= begin:
+                return name
+        return candidates[-1]
+
+    def oldest(self, level, sensor):
+        table = level if level == "raw" else f"rollup_{level}"
+        return self.connection.execute(f"SELECT min(t) FROM {table} WHERE sensor = ?", (sensor,)).fetchone()[0]
+
+    def query(self, sensor, start, end, maxPoints=2000, rawInterval=0.5, level=None):
+        # (t, mean, min, max, count) arrays in mbar; for raw, min and max are the reading
+        # itself and count is 1 for valid readings
+        level = level or self.level(sensor, start, end, maxPoints, rawInterval)
+        if level == "raw":
+            rows = self.connection.execute("SELECT t, pressure, pressure, pressure, pressure IS NOT NULL FROM raw"
+                                           " WHERE sensor = ? AND t >= ? AND t < ? ORDER BY t", (sensor, start, end)).fetchall()
+        else:
+            rows = self.connection.execute(f"SELECT t, sum / count, min, max, count FROM rollup_{level}"
+                                           " WHERE sensor = ? AND t >= ? AND t < ? ORDER BY t", (sensor, start, end)).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4].astype(np.int64)
+
+    def close(self):
+        self.connection.close()
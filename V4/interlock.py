@@ -0,0 +1,132 @@
+import time
+import numpy as np
+from gauge import convertPressure
+from status import SENSOR_ERROR, OPEN_CIRCUIT
+
+
+# Output backends only need write(tripped) and close()
+
+class SimulatedOutput:
+    def __init__(self):
+        self.state = False
+        self.writes = []
+
+    def write(self, tripped):
+        self.state = tripped
+        self.writes.append((time.perf_counter(), tripped))
+
+    def close(self):
+        pass
+
+
+class DigitalLineOutput:
+    def __init__(self, line, activeHigh=True):
+        import nidaqmx
+        self.activeHigh = activeHigh
+        self.task = nidaqmx.Task()
+        self.task.do_channels.add_do_chan(line)
+        self.task.start()
+
+    def write(self, tripped):
+        self.task.write(tripped == self.activeHigh)
+
+    def close(self):
+        self.task.close()
+
+
+class AnalogOutput:
+    def __init__(self, channel, tripVoltage=5.0, idleVoltage=0.0):
+        import nidaqmx
+        self.tripVoltage = tripVoltage
+        self.idleVoltage = idleVoltage
+        self.task = nidaqmx.Task()
+        self.task.ao_channels.add_ao_voltage_chan(channel, min_val=min(tripVoltage, idleVoltage, 0.0),
+                                                  max_val=max(tripVoltage, idleVoltage, 0.0))
+        self.task.start()
+
+    def write(self, tripped):
+        self.task.write(self.tripVoltage if tripped else self.idleVoltage)
+
+    def close(self):
+        self.task.close()
+
+
+class Interlock:
+    # Trips the output as soon as any condition holds. Conditions are evaluated on the
+    # block pressures right after the read returns, and latency is measured from that
+    # moment until the output write has completed. Under- and overrange readings carry
+    # a bound and are compared like any other; a failed or unplugged gauge has no
+    # pressure, so with tripOnInvalid it trips every condition on that sensor.
+
+    def __init__(self, output, conditions, latch=True, unit="mbar", tripOnInvalid=True):
+        self.output = output
+        self.latch = latch
+        self.tripOnInvalid = tripOnInvalid
+        self.sensors = np.array([c["sensor"] for c in conditions], dtype=np.intp)
+        self.above = np.array(["above" in c for c in conditions], dtype=bool)
+        limits = np.array([c["above"] if "above" in c else c["below"] for c in conditions], dtype=np.float64)
+        self.limits = convertPressure(limits, "mbar", unit)
+
+        self.tripped = False
+        self.resetRequested = False
+        self.tripLatency = None
+        self.lastCheckLatency = 0.0
+        self.maxCheckLatency = 0.0
+        self.output.write(False)
+
+    @staticmethod
+    def conditionsFromSettings(settings, nr_channels):
+        # Conditions that apply to the acquired channels, empty when the interlock is disabled
+        if not settings.get("enabled"):
+            return []
+        return [c for c in settings.get("conditions", []) if 0 <= c.get("sensor", -1) < nr_channels
+                and ("above" in c or "below" in c)]
+
+    @classmethod
+    def fromSettings(cls, settings, deviceID, nr_channels, unit="mbar", simulate=False):
+        # None when disabled or when no condition refers to an acquired channel
+        conditions = cls.conditionsFromSettings(settings, nr_channels)
+        if not conditions:
+            return None
+
+        backend = settings.get("backend", "digital")
+        if simulate or backend == "simulated":
+            output = SimulatedOutput()
+        elif backend == "analog":
+            output = AnalogOutput(f"{deviceID}/{settings.get('channel', 'ao0')}",
+                                  settings.get("trip_voltage", 5.0), settings.get("idle_voltage", 0.0))
+        else:
+            output = DigitalLineOutput(f"{deviceID}/{settings.get('channel', 'port0/line0')}",
+                                       settings.get("active_high", True))
+        return cls(output, conditions, settings.get("latch", True), unit, settings.get("trip_on_invalid", True))
+
+    def check(self, pressures, readTime, status=None):
+        # Returns the trip latency in seconds when this block tripped the output
+        if self.resetRequested:
+            self.resetRequested = False
+            self.tripped = False
+            self.output.write(False)
+
+        values = pressures[self.sensors]
+        trip = bool(np.any(np.where(self.above, values > self.limits, values < self.limits)))
+        if self.tripOnInvalid and status is not None:
+            trip = trip or bool(np.any(np.isin(status[self.sensors], (SENSOR_ERROR, OPEN_CIRCUIT))))
+        latency = None
+        if trip and not self.tripped:
+            self.output.write(True)
+            self.tripped = True
+            latency = self.tripLatency = time.perf_counter() - readTime
+        elif not trip and self.tripped and not self.latch:
+            self.output.write(False)
+            self.tripped = False
+
+        self.lastCheckLatency = time.perf_counter() - readTime
+        self.maxCheckLatency = max(self.maxCheckLatency, self.lastCheckLatency)
+        return latency
+
+    def reset(self):
+        # Applied by the thread that runs check, so the output is only written from one thread
+        self.resetRequested = True
+
+    def close(self):
+        self.output.close()
@@ -0,0 +1,102 @@
+from collections import deque
+import numpy as np
+
+
+class StreamingLinearFit:
+    # Least squares line y = a + b t per channel from running sums, so adding or removing
+    # a point is O(1). With a window (seconds) the oldest points drop out as new ones
+    # arrive; without one the fit covers everything since the last reset. Times are
+    # taken relative to the first point to keep the sums well conditioned.
+
+    def __init__(self, nr_channels, window=None):
+        self.nr_channels = nr_channels
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.origin = None
+        self.points = deque()
+        self.n = np.zeros(self.nr_channels)
+        self.st = np.zeros(self.nr_channels)
+        self.sy = np.zeros(self.nr_channels)
+        self.stt = np.zeros(self.nr_channels)
+        self.sty = np.zeros(self.nr_channels)
+
+    def accumulate(self, x, y, sign):
+        # Points without a value (NaN) are left out of that channel's fit
+        valid = np.isfinite(y)
+        y = np.where(valid, y, 0.0)
+        self.n += sign * valid
+        self.st += sign * x * valid
+        self.sy += sign * y
+        self.stt += sign * x * x * valid
+        self.sty += sign * x * y
+
+    def add(self, timestamp, values):
+        if self.origin is None:
+            self.origin = timestamp
+        x = timestamp - self.origin
+        values = np.asarray(values, dtype=np.float64)
+        self.accumulate(x, values, 1)
+
+        if self.window is not None:
+            self.points.append((x, values))
+            while x - self.points[0][0] > self.window:
+                self.accumulate(*self.points.popleft(), -1)
+
+    def addMany(self, times, values):
+        # Batch form for recorded histories, values is (points, channels)
+        times = np.asarray(times, dtype=np.float64)
+        if len(times) == 0:
+            return
+        if self.origin is None:
+            self.origin = times[0]
+        x = (times - self.origin)[:, None]
+        values = np.asarray(values, dtype=np.float64)
+        valid = np.isfinite(values)
+        y = np.where(valid, values, 0.0)
+        self.n += valid.sum(axis=0)
+        self.st += (x * valid).sum(axis=0)
+        self.sy += y.sum(axis=0)
+        self.stt += (x * x * valid).sum(axis=0)
+        self.sty += (x * y).sum(axis=0)
+
+    def slope(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            d = self.n * self.stt - self.st ** 2
+            return np.where((self.n >= 2) & (d > 0), (self.n * self.sty - self.st * self.sy) / d, np.nan)
+
+    def intercept(self):
+        # Value at the first point of the fit
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.sy - self.slope() * self.st) / self.n
+
+
+class LeakRateCalculator:
+    # Pressure rise test: leak rate Q = V dp/dt, in (pressure unit) l/s for a chamber
+    # volume in litres
+
+    def __init__(self, nr_channels, volume, window=None):
+        self.volume = volume
+        self.fit = StreamingLinearFit(nr_channels, window)
+
+    def mark(self):
+        self.fit.reset()
+
+    def add(self, timestamp, pressures):
+        self.fit.add(timestamp, pressures)
+
+    def riseRate(self):
+        return self.fit.slope()
+
+    def leakRate(self):
+        return self.volume * self.fit.slope()
+
+    def points(self):
+        return self.fit.n
+
+    @classmethod
+    def fromHistory(cls, times, pressures, volume):
+        calculator = cls(pressures.shape[1], volume)
+        calculator.fit.addMany(times, pressures)
+        return calculator
@@ -0,0 +1,176 @@
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# Live pressures for other programs on the same PC, in a named shared memory segment
+# ("pressure_reader_live" by default, /dev/shm/pressure_reader_live on Linux) that the
+# acquisition process updates after every block while acquiring. Everything is little
+# endian:
+#
+#   offset  type        field
+#   0       char[8]     magic "FRGLIVE1"
+#   8       uint32      version (1)
+#   12      uint32      channels (n)
+#   16      uint32      history (h, number of records in the ring)
+#   20      uint32      record size in bytes (8 + 8n + n rounded up to 8)
+#   24      char[8]     pressure unit, NUL padded ("mbar", "Torr", "Pa")
+#   32      uint64      sequence, odd while the writer is updating
+#   40      uint64      count, records written so far
+#   48      uint32      state, 1 while acquiring and 0 once stopped
+#   52      uint32      reserved
+#   56      float64     start time of the run, epoch seconds
+#   64      records     h records of: float64 timestamp (epoch seconds), n float64
+#                       pressures (NaN without a valid reading), n uint8 status codes
+#                       (see status.py), padding
+#
+# The newest record is number (count - 1) % h. To read consistently, read the sequence,
+# retry while it is odd, copy what is needed, and retry if the sequence has changed.
+# LiveFeedReader does this for Python programs.
+
+MAGIC = b"FRGLIVE1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII8sQQIId")
+HEADER_SIZE = 64
+SEQUENCE_OFFSET = 32
+# A segment whose state says acquiring but whose newest record is older than this was
+# left by a writer that did not stop cleanly
+STALE_SECONDS = 10.0
+
+
+def recordDtype(nr_channels):
+    size = 8 + 9 * nr_channels
+    return np.dtype({"names": ["t", "p", "s"], "formats": ["<f8", ("<f8", (nr_channels,)), ("u1", (nr_channels,))],
+                     "offsets": [0, 8, 8 + 8 * nr_channels], "itemsize": (size + 7) // 8 * 8})
+
+
+def attachSharedMemory(name):
+    # Attach to a segment owned by another process. Before Python 3.13 attaching
+    # registers the segment with this process's resource tracker, which would
+    # unlink it when this process exits, so it is unregistered again.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    memory = shared_memory.SharedMemory(name)
+    if sys.platform != "win32":
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+
+class LiveFeedWriter:
+    def __init__(self, name, nr_channels, history, unit, startTime):
+        self.dtype = recordDtype(nr_channels)
+        size = HEADER_SIZE + history * self.dtype.itemsize
+        sequence = 0
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Still open in a reader (on Windows it lives as long as any handle does) or
+            # left behind by a run that did not stop cleanly
+            self.memory = attachSharedMemory(name)
+            sequence = self.reuse(name, nr_channels, history, size)
+
+        # Readers that stay attached see the sequence move on and the count start over
+        HEADER.pack_into(self.memory.buf, 0, MAGIC, VERSION, nr_channels, history, self.dtype.itemsize,
+                         unit.encode()[:8], sequence, 0, 1, 0, startTime)
+        self.control = np.ndarray((2,), dtype="<u8", buffer=self.memory.buf, offset=SEQUENCE_OFFSET)
+        self.records = np.ndarray((history,), dtype=self.dtype, buffer=self.memory.buf, offset=HEADER_SIZE)
+        self.history = history
+
+    def reuse(self, name, nr_channels, history, size):
+        # Takes over an existing segment with the same layout and returns the sequence
+        # to continue from. Refuses while another writer is still publishing in it.
+        magic, version, channels, records, recordSize, _, sequence, count, state, _, startTime = \
+            HEADER.unpack_from(self.memory.buf, 0) if self.memory.size >= HEADER_SIZE else (b"",) + (0,) * 10
+        if magic == MAGIC and state == 1:
+            last = startTime
+            if count and channels and records and self.memory.size >= HEADER_SIZE + records * recordSize:
+                last = max(last, struct.unpack_from("<d", self.memory.buf, HEADER_SIZE + (count - 1) % records * recordSize)[0])
+            if time.time() - last < STALE_SECONDS:
+                self.memory.close()
+                raise RuntimeError(f"The live feed {name} is being published by another running instance")
+        if (magic, version, channels, records, recordSize) == (MAGIC, VERSION, nr_channels, history, self.dtype.itemsize) \
+                and self.memory.size >= size:
+            return (sequence + 1) // 2 * 2 + 2
+
+        # A different layout cannot be reused; replace it unless a reader still holds it
+        self.memory.close()
+        stale = shared_memory.SharedMemory(name)
+        stale.close()
+        stale.unlink()
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            raise RuntimeError(f"The live feed {name} is still open in another program with a different layout; "
+                               "close it or change the feed name")
+        return 0
+
+    @classmethod
+    def fromSettings(cls, settings, nr_channels, unit, startTime):
+        if not settings.get("enabled"):
+            return None
+        return cls(settings.get("name", "pressure_reader_live"), nr_channels, settings.get("history", 600), unit, startTime)
+
+    def write(self, timestamp, pressures, status):
+        count = int(self.control[1])
+        record = self.records[count % self.history:count % self.history + 1]
+        self.control[0] += 1
+        record["t"] = timestamp
+        record["p"] = pressures
+        record["s"] = status
+        self.control[1] = count + 1
+        self.control[0] += 1
+
+    def close(self):
+        struct.pack_into("<I", self.memory.buf, 48, 0)
+        self.control = self.records = None
+        self.memory.close()
+        self.memory.unlink()
+
+
+class LiveFeedReader:
+    # e.g. feed = LiveFeedReader(); timestamp, pressures, status = feed.latest()
+
+    def __init__(self, name="pressure_reader_live"):
+        self.memory = attachSharedMemory(name)
+        magic, version, self.nr_channels, self.history, recordSize, unit, _, _, _, _, self.startTime = \
+            HEADER.unpack_from(self.memory.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.memory.close()
+            raise ValueError(f"{name} is not a version {VERSION} pressure feed")
+        self.unit = unit.rstrip(b"\0").decode()
+        self.control = np.ndarray((2,), dtype="<u8", buffer=self.memory.buf, offset=SEQUENCE_OFFSET)
+        self.records = np.ndarray((self.history,), dtype=recordDtype(self.nr_channels), buffer=self.memory.buf, offset=HEADER_SIZE)
+
+    def live(self):
+        return struct.unpack_from("<I", self.memory.buf, 48)[0] == 1
+
+    def count(self):
+        return int(self.control[1])
+
+    def read(self, points):
+        # Up to `points` newest records, oldest first, as (timestamps, pressures, status)
+        while True:
+            sequence = int(self.control[0])
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            count = int(self.control[1])
+            points = min(points, count, self.history)
+            index = np.arange(count - points, count) % self.history
+            records = self.records[index]
+            if int(self.control[0]) == sequence:
+                return records["t"], records["p"], records["s"]
+
+    def latest(self):
+        # (timestamp, pressures, status) of the newest record, None before the first one
+        t, p, s = self.read(1)
+        if len(t) == 0:
+            return None
+        return float(t[0]), p[0], s[0]
+
+    def close(self):
+        self.control = self.records = None
+        self.memory.close()
@@ -0,0 +1,90 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from config import CONFIG_DIR
+
+
+# Records are written by a listener thread, so the reader and GUI threads never wait on
+# the file or the console. QueueHandler still formats the message (and any traceback)
+# in the calling thread, so arguments are captured as they were at the call; repeated
+# messages are rate limited before that, so a message that is dropped costs nothing.
+# The console handler is left out when there is no console, as in the windowed
+# PyInstaller build.
+
+LOG_DIR = os.path.join(CONFIG_DIR, "logs")
+LOG_FILE = os.path.join(LOG_DIR, "pressure_reader.log")
+FORMAT = "%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    # Passes at most `burst` records per message per `interval` seconds. Records are
+    # keyed by logger and format string, so messages with changing arguments still
+    # count as one. The number suppressed is added to the next record that passes.
+
+    def __init__(self, burst=5, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        start, count, suppressed = self.windows.get(key, (now, 0, 0))
+        if now - start >= self.interval:
+            start, count = now, 0
+        if count >= self.burst:
+            self.windows[key] = (start, count, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        self.windows[key] = (start, count + 1, 0)
+        return True
+
+
+_listener = None
+
+
+def setupLogging(settings):
+    # settings is the "logging" section; safe to call again, the old listener is replaced
+    global _listener
+    stopLogging()
+
+    formatter = logging.Formatter(FORMAT)
+    handlers = []
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        fileHandler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=settings.get("file_bytes", 1000000),
+                                                           backupCount=settings.get("backups", 5), encoding="utf-8")
+        handlers.append(fileHandler)
+    except OSError as e:
+        if sys.stderr is not None:
+            sys.stderr.write(f"Log file could not be opened: {e}\n")
+    if sys.stderr is not None:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queueHandler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queueHandler.addFilter(RateLimitFilter(settings.get("burst", 5), settings.get("interval", 10.0)))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queueHandler)
+    root.setLevel(settings.get("level", "INFO"))
+
+    _listener = logging.handlers.QueueListener(queueHandler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stopLogging():
+    # Flushes everything still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
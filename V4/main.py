@@ -1,268 +1,527 @@
+import logging
 import os
+import sqlite3
 import sys
-import pandas as pd
+import threading
 from PyQt5.QtGui import QIcon, QIntValidator, QDoubleValidator
 from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget, QLineEdit, QLabel, QFrame, \
-    QButtonGroup, QRadioButton, QHBoxLayout, QComboBox, QMessageBox, QFileDialog, QSizePolicy, QAction, QSplitter, \
-    QMenuBar
-from PyQt5.QtCore import QObject, pyqtSignal, QThread, QTimer, Qt, QEventLoop
-import nidaqmx
+    QButtonGroup, QRadioButton, QHBoxLayout, QComboBox, QMessageBox, QFileDialog, QSizePolicy, \
+    QDialog, QGridLayout, QDialogButtonBox, QPlainTextEdit, QSpinBox
+import csv
+from PyQt5.QtCore import QObject, pyqtSignal, QThread, QTimer, Qt
 import time
-import nidaqmx
-from nidaqmx.constants import * #(AcquisitionType)
-from nidaqmx.stream_readers import (
-    AnalogMultiChannelReader)
+from datetime import datetime
 import numpy as np
-from nidaqmx.system import System
-import pyqtgraph as pg
+from pressurelog import PressureLog
+from acquisition import AcquisitionConfig, AcquisitionProcess
+from alarms import AlarmEngine
+from interlock import Interlock
+from spectrum import WelchEstimator, blockSpectrum, segmentLength
+from analysis import AnalysisExecutor
+from leakrate import LeakRateCalculator
+from server import ReadingServer
+from history import HistoryStore
+from metrics import REGISTRY, MetricsServer
+from tracing import TRACER
+from logs import setupLogging, stopLogging
+from discovery import DeviceDiscovery
+from compression import recorderFromSettings
+from channels import channelsFromSettings, inputRange, validateChannels
+from planner import planAcquisition, sampleCost
+import multiprocessing
+from config import CONFIG_DIR, loadSettings, saveSettings
+from gauge import UNITS, convertPressure
+from calibration import CalibrationStore, GaugeCalibration
+import status as sensorstatus
 
 basedir = os.path.dirname(__file__)
+log = logging.getLogger(__name__)
 
 DEBUG = True
-
-class AnalogInStream(nidaqmx.Task):
-
-    def __init__(self, deviceID, nr_samples, nr_channels):
-        super().__init__()
-        self.ai_channels.add_ai_voltage_chan(deviceID + "/ai0")
-        self.reader = AnalogMultiChannelReader(self.in_stream)
-
-        self.nr_channels = nr_channels
-        self.nr_samples = int(nr_samples)
-
-        # Creating the buffer
-        self.acq_data = np.zeros((self.nr_channels, self.nr_samples), dtype=np.float64)
-
-    def configureClock(self, sample_rate):
-        try:
-            self.timing.cfg_samp_clk_timing(int(sample_rate), sample_mode=AcquisitionType.CONTINUOUS, samps_per_chan=self.nr_samples * 50)
-        except NameError:
-            print("Name Error")
-
-    def acquire_data(self):
-        print("Acquire Data")
-
-        if DEBUG:
-            return [[np.random.randint(1,11)] for i in range(self.nr_channels)]
-
-        try:
-            if self.reader is not None:
-                self.reader.read_many_sample(self.acq_data, number_of_samples_per_channel=self.nr_samples)
-        except nidaqmx.errors.DaqError as e:
-            raise RuntimeError("Failed to acquire data: " + str(e))
-
-        return self.acq_data
-
-    def close_task(self):
-        print("Closing Task")
-        self.close()
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close_task()
-        if exc_type is not None:
-            raise
+# Acquisition, the run log and everything published outside the window work in this
+# unit; the unit buttons only change what is displayed and exported
+CANONICAL_UNIT = "mbar"
+
+BLOCKS_READ = REGISTRY.counter("blocks_read", "Blocks acquired from the DAQ")
+BLOCKS_HANDLED = REGISTRY.counter("blocks_handled", "Blocks shown by the GUI")
+BLOCK_PROCESS_SECONDS = REGISTRY.histogram("block_process_seconds", "Filter, conversion, interlock and alarm time per block")
+GUI_QUEUE_DEPTH = REGISTRY.gauge("gui_queue_depth", "Blocks emitted by the reader and not yet handled by the GUI")
+GUI_UPDATE_SECONDS = REGISTRY.histogram("gui_update_seconds", "Time spent in MainWindow.updateUI per block")
+PLOT_REDRAW_SECONDS = REGISTRY.histogram("plot_redraw_seconds", "Time spent redrawing the graph window")
+ANALYSIS_DROPPED = REGISTRY.counter("dropped_blocks", "Blocks skipped by a stage that could not keep up", stage="analysis")
+GUI_DROPPED = REGISTRY.counter("dropped_blocks", "Blocks skipped by a stage that could not keep up", stage="gui")
+DAQ_READ_SECONDS = REGISTRY.histogram("daq_read_seconds", "Time spent in read_many_sample per block")
+DAQ_AVAILABLE = REGISTRY.gauge("daq_available_samples", "Samples per channel waiting in the device buffer before a read")
+DAQ_ERRORS = REGISTRY.counter("daq_errors", "Acquisition runs ended by a DAQ error")
+RECONNECTS = REGISTRY.counter("reconnects", "Acquisition restarts after a DAQ error")
+CAPTURES = REGISTRY.counter("captures", "Triggered raw captures written to disk")
 
 class Reader(QObject):
-    data_ready = pyqtSignal(np.ndarray)  # Signal to emit the received data
-    error_occurred = pyqtSignal()
+    # Starts the acquisition process and turns what it announces into signals. Runs in
+    # its own QThread and only reads the shared memory ring, so a slow GUI costs at most
+    # skipped blocks here and never a late read.
+    data_ready = pyqtSignal(float, np.ndarray, np.ndarray)  # Signal to emit the block time, pressures and sensor status
+    alarm_changed = pyqtSignal(list)
+    interlock_tripped = pyqtSignal(float)
+    spectrum_ready = pyqtSignal(np.ndarray, np.ndarray)  # Frequencies and PSD per channel
+    error_occurred = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
-        self.reader = None
+        self.config = None
+        self.acquisition = None
         self.isRunning = False
-        self.deviceID = None
-
-    def setSamplingAndReadRate(self, samplingRate, readRate, nr_channels = 1):
-        self.samplingRate = samplingRate
-        self.nr_samples = int(readRate * self.samplingRate)
-        self.nr_channels = nr_channels
+        self.spectrum = None
+        self.executor = None
+        self.analysisProcesses = 0
+        self.server = None
+        self.history = None
+        self.pressureGauges = []
+
+    def setConfig(self, config):
+        self.config = config
+        self.samplingRate = config.samplingRate
+        self.readRate = config.readRate
+        self.nr_samples = int(config.readRate * config.samplingRate)
+        self.nr_channels = config.nr_channels
+        self.pressureGauges = [REGISTRY.gauge("pressure", "Latest block pressure", sensor=f"AI{i}", unit=config.unit)
+                               for i in range(config.nr_channels)]
+
+    def setAnalysisProcesses(self, processes):
+        self.analysisProcesses = processes
+
+    def startAnalysis(self):
+        # Spawned on the first block that needs analysis, so a run without the spectrum
+        # window never starts the worker processes
+        try:
+            self.executor = AnalysisExecutor((self.nr_channels, self.nr_samples), self.analysisProcesses)
+        except OSError as e:
+            log.warning("Analysis runs in the reader thread: %s", e)
+            self.analysisProcesses = 0
 
-    def setDeviceID(self,deviceID):
-        self.deviceID = deviceID
+    def stopAnalysis(self):
+        if self.executor is not None:
+            self.executor.close()
+            self.executor = None
 
     def run(self):
-        print("Run")
-        if DEBUG:
-            self.isRunning = True
-            while self.isRunning:
-                data = [np.random.randint(1,11) for i in range(self.nr_channels)]
-                self.data_ready.emit(np.array(data))
-                self.delay(500)
+        self.executor = None
+        self.isRunning = True
+        self.acquisition = None
+        try:
+            self.acquisition = AcquisitionProcess(self.config)
+            self.acquisition.start()
+            self.lastSeq = 0
+            while True:
+                message = self.acquisition.next(timeout=0.5)
+                if message is None:
+                    if not self.acquisition.isAlive():
+                        self.error_occurred.emit("The acquisition process ended unexpectedly")
+                        break
+                elif isinstance(message, logging.LogRecord):
+                    logging.getLogger(message.name).handle(message)
+                elif message[0] == "block":
+                    self.readBlock(message[1])
+                elif message[0] == "alarms":
+                    self.alarm_changed.emit(message[1])
+                elif message[0] == "trip":
+                    self.interlock_tripped.emit(message[1])
+                elif message[0] == "capture":
+                    CAPTURES.inc()
+                    log.info("Capture written to %s", message[1])
+                elif message[0] == "started":
+                    log.info("Acquisition started")
+                elif message[0] == "error":
+                    self.error_occurred.emit(message[1])
+                elif message[0] == "stopped":
+                    break
+        except OSError as e:
+            log.error("Acquisition process could not be started: %s", e)
+            self.error_occurred.emit(str(e))
+        finally:
+            self.isRunning = False
+            if self.acquisition is not None:
+                self.acquisition.close()
+                self.acquisition = None
+            self.stopAnalysis()
+
+    def readBlock(self, seq):
+        spectrum = self.spectrum
+        record = self.acquisition.ring.read(seq, withBlock=spectrum is not None)
+        if seq - self.lastSeq > 1:
+            GUI_DROPPED.inc(seq - self.lastSeq - 1)
+        self.lastSeq = seq
+        if record is None:
+            # Overwritten before it could be read, the GUI is more than a ring behind
+            GUI_DROPPED.inc()
+            return
+
+        BLOCKS_READ.inc()
+        DAQ_READ_SECONDS.observe((record.readEndNs - record.readStartNs) / 1e9)
+        DAQ_AVAILABLE.set(record.available)
+        BLOCK_PROCESS_SECONDS.observe((record.processEndNs - record.readEndNs) / 1e9)
+        TRACER.complete("acquire_data", record.readStartNs, record.readEndNs - record.readStartNs, "Acquisition process")
+        TRACER.complete("pipeline", record.readEndNs, record.processEndNs - record.readEndNs, "Acquisition process")
+        for gauge, pressure in zip(self.pressureGauges, record.pressures):
+            gauge.set(pressure)
+        if self.server is not None:
+            self.server.publish("block", record.timestamp, record.pressures, record.status, self.config.unit)
+        if self.history is not None:
+            self.history.add(record.timestamp, record.pressures, record.status, self.config.unit)
+        # The hop to the GUI thread is traced as an async span keyed by the block time
+        TRACER.begin("signal", record.timestamp)
+        self.data_ready.emit(record.timestamp, record.pressures, record.status)
+
+        # Only estimated while the spectrum window is open, on the raw block. With worker
+        # processes the result of a block arrives on a later block, in order.
+        if spectrum is not None:
+            with TRACER.span("spectrum"):
+                self.updateSpectrum(spectrum, record.block)
+
+    def updateSpectrum(self, spectrum, data):
+        if self.executor is None and self.analysisProcesses > 0:
+            self.startAnalysis()
+        if self.executor is not None:
+            if not self.executor.submit(blockSpectrum, data, spectrum.sampleRate, spectrum.nperseg, spectrum.nr_segments):
+                ANALYSIS_DROPPED.inc()
+            psds = self.executor.collect()
         else:
-            try:
-                with AnalogInStream(self.deviceID, self.nr_samples, self.nr_channels) as self.reader:
-                    self.reader.configureClock(self.samplingRate)
-                    self.isRunning = True
-                    while self.isRunning:
-                        data = self.reader.acquire_data()
-                        self.data_ready.emit(data)
-            except RuntimeError as e:
-                print(e)
-                # self.stop()
-                self.error_occurred.emit()
-
+            psds = [spectrum.blockPsd(data)]
+        psds = [psd for psd in psds if psd is not None]
+        for psd in psds:
+            spectrum.accumulate(psd)
+        if psds:
+            self.spectrum_ready.emit(spectrum.freqs, spectrum.psd.copy())
 
     def stop(self):
-        print("Reader.Stop")
-        self.isRunning = False
-        if self.reader and not DEBUG:
-            self.reader.stop()
-            self.reader.close()
-
-    def delay(self,delay):
-        loop = QEventLoop()
-        QTimer.singleShot(delay, loop.quit)
-        loop.exec_()
-
-class GraphWindow(QMainWindow):
-    COLORS = ['r', 'b', 'g', 'y', 'o', 'k']
-    STATUS_MERGED = 0
-    STATUS_SPLIT = 1
-    def __init__(self,parent):
+        # Called from the GUI thread, run() returns once the process has stopped
+        log.debug("Reader.Stop")
+        acquisition = self.acquisition
+        if acquisition is not None:
+            acquisition.stop()
+
+    def resetInterlock(self):
+        acquisition = self.acquisition
+        if acquisition is not None:
+            acquisition.resetInterlock()
+
+class LeakRateWindow(QMainWindow):
+    def __init__(self, parent, nr_sensors):
         super().__init__(parent)
-        self.plotStatus = GraphWindow.STATUS_MERGED
-        self.setWindowTitle("Pressure Graph")
-        self.setGeometry(100, 100, 800, 600)
+        self.setWindowTitle("Leak Rate")
+        self.nr_sensors = nr_sensors
+        self.calculator = None
 
-        # Create a central widget and set the layout
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
-
-        self.main_layout = QVBoxLayout(self.central_widget)
-
-        # Create a menu bar
-        self.menu_bar = QMenuBar(self)
-        self.setMenuBar(self.menu_bar)
-
-        # Add a menu and action to split the graph
-        self.view_menu = self.menu_bar.addMenu("View")
-        self.split_action = QAction("Split", self)
-        self.combine_action = QAction("Combine", self)
-        self.split_action.triggered.connect(self.splitGraphs)
-        self.combine_action.triggered.connect(self.combineGraphs)
-        self.view_menu.addAction(self.split_action)
-        self.view_menu.addAction(self.combine_action)
-
-        # Create a layout for the plot widgets
-        self.plot_layout = QVBoxLayout()
-        self.main_layout.addLayout(self.plot_layout)
-
-        # Create a plot widget
-        self.plot_widget = pg.PlotWidget()
-        self.plot_widget.setBackground('w')
-        self.plot_widget.setTitle("Pressure", color="black", size="12pt")
-        self.plot_layout.addWidget(self.plot_widget)
-
-        self.plot_widgets = [self.plot_widget]
-        self.y_unit = "None"
-        self.combine_action.setEnabled(False)
-
-    def setYLabel(self,ylabel):
-        self.y_unit = ylabel
-
-    def updateYlabel(self,index = 0):
-        self.plot_widgets[index].setLabel('left', self.y_unit, color='black', size='12pt')
-
-    def xlabel(self, xlabel="Time (min)", index = 0):
-        self.plot_widgets[index].setLabel('bottom', xlabel, color='black', size='12pt')
-
-    def plotData(self, x=None, y=None, color ='r', index = 0, symbol='o', symbolSize=8):
-        if x is None or y is None:
-            x = np.linspace(0, 10, 100)
-            y = np.sin(x)
-        if len(self.plot_widgets)==1:
-            index = 0
-        # Plot the data
-        self.plot_widgets[index].plot(x, y, pen=pg.mkPen(color=color, width=2), symbol=symbol, symbolSize=symbolSize, symbolBrush=pg.mkBrush(color))
-        self.updateYlabel(index=index)
-        self.xlabel()
-
-    def addLegend(self):
-        self.legend = pg.LegendItem((80, 60), offset=(30, 30))
-        self.legend.setParentItem(self.plot_widgets[0].graphicsItem())
-        if len(self.plot_widgets) == 1:
-            for i,plot in enumerate(self.plot_widgets[0].getPlotItem().items):
-                self.legend.addItem(plot,f"Senor AI{i}")
-
-
-    def clearGraph(self):
-        for plot in self.plot_widgets:
-            plot.clear()
+        layout = QGridLayout(self.central_widget)
+
+        layout.addWidget(QLabel("Chamber Volume (l)", self), 0, 0)
+        self.volume_edit = QLineEdit("10", self)
+        self.volume_edit.setValidator(QDoubleValidator())
+        layout.addWidget(self.volume_edit, 0, 1, 1, 2)
+        layout.addWidget(QLabel("Sliding Window (s)", self), 1, 0)
+        self.window_edit = QLineEdit(self)
+        self.window_edit.setPlaceholderText("since mark")
+        self.window_edit.setValidator(QDoubleValidator())
+        layout.addWidget(self.window_edit, 1, 1, 1, 2)
+
+        self.mark_button = QPushButton("Mark Start", self)
+        self.mark_button.clicked.connect(self.markClicked)
+        self.history_button = QPushButton("Fit Recorded Data", self)
+        self.history_button.clicked.connect(self.historyClicked)
+        layout.addWidget(self.mark_button, 2, 0, 1, 2)
+        layout.addWidget(self.history_button, 2, 2)
+
+        for column, text in enumerate(["Sensor", "Live", "Recorded"]):
+            layout.addWidget(QLabel(f"<b>{text}</b>", self), 3, column)
+        self.live_labels = []
+        self.history_labels = []
+        for i in range(nr_sensors):
+            layout.addWidget(QLabel(f"AI{i}", self), i + 4, 0)
+            self.live_labels.append(QLabel("", self))
+            self.history_labels.append(QLabel("", self))
+            layout.addWidget(self.live_labels[-1], i + 4, 1)
+            layout.addWidget(self.history_labels[-1], i + 4, 2)
+        self.markClicked()
+
+    def readInputs(self):
+        try:
+            volume = float(self.volume_edit.text())
+        except ValueError:
+            volume = 1.0
+        try:
+            window = float(self.window_edit.text())
+        except ValueError:
+            window = None
+        return volume, window if window else None
+
+    def unit(self):
+        return self.parent().getCurrentPressureUnit()
+
+    def markClicked(self):
+        volume, window = self.readInputs()
+        self.calculator = LeakRateCalculator(self.nr_sensors, volume, window)
+        for label in self.live_labels:
+            label.setText("waiting for data")
+
+    def addPoint(self, timestamp, pressures, status):
+        if len(pressures) != self.nr_sensors:
+            return
+        # Only valid readings, like the fit of the recorded data
+        self.calculator.add(timestamp, np.where(status == sensorstatus.VALID, pressures, np.nan))
+        self.showRates(self.live_labels, self.calculator)
+
+    def historyClicked(self):
+        log = self.parent().log
+        if log is None or len(log) == 0:
+            return
+        volume, window = self.readInputs()
+        start = log.times()[-1] - window if window else None
+        t, pressure, status = log.read(start)
+        pressure = np.where(status == sensorstatus.VALID, pressure, np.nan)
+        self.showRates(self.history_labels, LeakRateCalculator.fromHistory(t, pressure[:, :self.nr_sensors], volume))
+
+    def showRates(self, labels, calculator):
+        # Rates are calculated in the canonical unit, the scale to the shown one is exact
+        unit = self.unit()
+        scale = float(convertPressure(1.0, CANONICAL_UNIT, unit))
+        for label, rise, leak, points in zip(labels, calculator.riseRate() * scale, calculator.leakRate() * scale, calculator.points()):
+            if np.isnan(rise):
+                label.setText(f"{int(points)} points")
+            else:
+                label.setText(f"dp/dt {rise:.3e} {unit}/s<br>Q {leak:.3e} {unit}·l/s ({int(points)} points)")
 
     def closeEvent(self, event):
-        if hasattr(self.parent(),"onGraphClosed"):
-            self.parent().onGraphClosed()
+        if hasattr(self.parent(),"onLeakClosed"):
+            self.parent().onLeakClosed()
         super().closeEvent(event)
 
-    def combineGraphs(self):
-        for i in reversed(range(self.splitter.count())):
-            self.splitter.widget(i).setParent(None)
-        self.splitter.setParent(None)
-        self.splitter = None
-
-        plot_widget = pg.PlotWidget()
-        plot_widget.setBackground('w')
-        plot_widget.setTitle(f"Pressure", color="black", size="12pt")
-        plot_widgets = self.plot_widgets
-        self.plot_widgets = [plot_widget]
-        for i,plot in enumerate(plot_widgets):
-            x, y = plot.getPlotItem().items[0].getData()
-            self.plotData(x, y, GraphWindow.COLORS[i])
-
-        self.plot_layout.addWidget(plot_widget)
-        self.updateYlabel()
-        self.xlabel()
-        self.addLegend()
-        self.split_action.setEnabled(True)
-        self.combine_action.setEnabled(False)
-
-
-    def splitGraphs(self):
+class DeviceWatcher(QObject):
+    # Carries device list updates from the discovery thread to the GUI thread
+    devices_changed = pyqtSignal(list)
 
+class PlanWatcher(QObject):
+    # Tells the GUI thread that the pipeline cost for the acquisition plan is known
+    cost_measured = pyqtSignal()
 
-        plot_widget = self.plot_widgets[0]
-        plots = plot_widget.getPlotItem().items
-        print(plots)
-
-        self.splitter = QSplitter(Qt.Vertical)
-        self.plot_widgets = []
-
-        for i in range(len(plots)):
-            plot_widget = pg.PlotWidget()
-            plot_widget.setBackground('w')
-            plot_widget.setTitle(f"Pressure (Sensor AI{i + 1})", color="black", size="12pt")
-
-            self.splitter.addWidget(plot_widget)
-            self.plot_widgets.append(plot_widget)
-            x, y = plots[i].getData()
-            self.plotData(x, y, GraphWindow.COLORS[i], i)
-            self.updateYlabel(i)
-            self.xlabel(index=i)
+class MetricsDialog(QDialog):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("Metrics")
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.resize(600, 500)
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        layout.addWidget(self.text)
+
+        traceLayout = QHBoxLayout()
+        self.trace_seconds = QSpinBox(self)
+        self.trace_seconds.setRange(1, 3600)
+        self.trace_seconds.setValue(60)
+        self.trace_seconds.setSuffix(" s")
+        self.trace_button = QPushButton("Record Trace", self)
+        self.trace_button.clicked.connect(self.traceClicked)
+        self.trace_label = QLabel("", self)
+        traceLayout.addWidget(self.trace_seconds)
+        traceLayout.addWidget(self.trace_button)
+        traceLayout.addWidget(self.trace_label, 1)
+        layout.addLayout(traceLayout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        # Histogram buckets are left out to keep the panel readable
+        lines = [line for line in REGISTRY.render().splitlines() if "_bucket{" not in line and not line.startswith("#")]
+        scroll = self.text.verticalScrollBar().value()
+        self.text.setPlainText("\n".join(lines))
+        self.text.verticalScrollBar().setValue(scroll)
+        self.trace_button.setText("Stop Trace" if TRACER.enabled else "Record Trace")
+        if not TRACER.enabled and TRACER.path is not None:
+            self.trace_label.setText(f"Last trace: {TRACER.path}")
+
+    def traceClicked(self):
+        # Open the file in chrome://tracing or https://ui.perfetto.dev
+        if TRACER.enabled:
+            TRACER.stop()
+        else:
+            path = os.path.join(CONFIG_DIR, "traces", datetime.now().strftime("trace-%Y%m%d-%H%M%S.json"))
+            TRACER.start(path, self.trace_seconds.value())
+            self.trace_label.setText(f"Tracing to {path}")
+        self.refresh()
 
+class AlarmDialog(QDialog):
+    def __init__(self, parent, nr_sensors):
+        super().__init__(parent)
+        self.setWindowTitle("Alarm Settings")
+        self.settings = loadSettings()
+        alarms = self.settings["alarms"]
+        sensors = alarms["sensors"]
+
+        layout = QGridLayout(self)
+        for column, text in enumerate(["Sensor", "High (mbar)", "Low (mbar)", "Rise (decades/s)"]):
+            layout.addWidget(QLabel(f"<b>{text}</b>", self), 0, column)
+
+        self.edits = []
+        for i in range(nr_sensors):
+            sensor = sensors[i] if i < len(sensors) else {}
+            layout.addWidget(QLabel(f"AI{i}", self), i + 1, 0)
+            row = {}
+            for column, kind in enumerate(AlarmEngine.KINDS):
+                edit = QLineEdit(self)
+                edit.setPlaceholderText("off")
+                if sensor.get(kind) is not None:
+                    edit.setText(str(sensor[kind]))
+                layout.addWidget(edit, i + 1, column + 1)
+                row[kind] = edit
+            self.edits.append(row)
+
+        self.hysteresis_edit = QLineEdit(str(alarms["hysteresis"] * 100), self)
+        self.hysteresis_edit.setValidator(QDoubleValidator(0, 100, 2))
+        self.debounce_edit = QLineEdit(str(alarms["debounce"]), self)
+        self.debounce_edit.setValidator(QIntValidator(1, 1000))
+        row = nr_sensors + 1
+        layout.addWidget(QLabel("Hysteresis (%)", self), row, 0, 1, 2)
+        layout.addWidget(self.hysteresis_edit, row, 2, 1, 2)
+        layout.addWidget(QLabel("Debounce (blocks)", self), row + 1, 0, 1, 2)
+        layout.addWidget(self.debounce_edit, row + 1, 2, 1, 2)
+        layout.addWidget(QLabel("Changes apply from the next Start.", self), row + 2, 0, 1, 4)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons, row + 3, 0, 1, 4)
+
+    def accept(self):
+        sensors = self.settings["alarms"]["sensors"]
+        for i, row in enumerate(self.edits):
+            sensor = {}
+            for kind, edit in row.items():
+                try:
+                    sensor[kind] = float(edit.text())
+                except ValueError:
+                    sensor[kind] = None
+            if i < len(sensors):
+                sensors[i] = sensor
+            else:
+                sensors.append(sensor)
 
-        for i in range(self.plot_layout.count()):
-            self.plot_layout.itemAt(i).widget().setParent(None)
-        self.plot_layout.addWidget(self.splitter)
-        self.split_action.setEnabled(False)
-        self.combine_action.setEnabled(True)
+        try:
+            self.settings["alarms"]["hysteresis"] = float(self.hysteresis_edit.text()) / 100
+            self.settings["alarms"]["debounce"] = int(self.debounce_edit.text())
+        except ValueError:
+            pass
+        saveSettings(self.settings)
+        super().accept()
+
+class CalibrationDialog(QDialog):
+    def __init__(self, parent, nr_sensors):
+        super().__init__(parent)
+        self.setWindowTitle("Calibration")
+        self.settings = loadSettings()
+        self.store = CalibrationStore()
+        serials = self.settings["gauges"]
+
+        layout = QGridLayout(self)
+        for column, text in enumerate(["Sensor", "Gauge Serial", "Offset (V)", "Gain", "Custom Curve"]):
+            layout.addWidget(QLabel(f"<b>{text}</b>", self), 0, column)
+
+        self.rows = []
+        for i in range(nr_sensors):
+            calibration = self.store.get(serials[i] if i < len(serials) else "")
+            serial_edit = QLineEdit(calibration.serial, self)
+            serial_edit.setPlaceholderText("none")
+            offset_edit = QLineEdit(str(calibration.offset), self)
+            offset_edit.setValidator(QDoubleValidator())
+            gain_edit = QLineEdit(str(calibration.gain), self)
+            gain_edit.setValidator(QDoubleValidator())
+            curve_button = QPushButton(self)
+            row = {"serial": serial_edit, "offset": offset_edit, "gain": gain_edit, "button": curve_button, "curve": calibration.curve}
+            curve_button.clicked.connect(lambda checked, row=row: self.curveClicked(row))
+            serial_edit.editingFinished.connect(lambda row=row: self.serialChanged(row))
+            self.updateCurveButton(row)
+
+            layout.addWidget(QLabel(f"AI{i}", self), i + 1, 0)
+            layout.addWidget(serial_edit, i + 1, 1)
+            layout.addWidget(offset_edit, i + 1, 2)
+            layout.addWidget(gain_edit, i + 1, 3)
+            layout.addWidget(curve_button, i + 1, 4)
+            self.rows.append(row)
+
+        row = nr_sensors + 1
+        layout.addWidget(QLabel("Curves are CSV files of voltage (V), pressure (mbar) rows.<br>Sensors without a serial use the FRG law. Changes apply from the next Start.", self), row, 0, 1, 5)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons, row + 1, 0, 1, 5)
+
+    def updateCurveButton(self, row):
+        row["button"].setText(f"Clear ({len(row['curve'])} points)" if row["curve"] else "Load CSV")
+
+    def serialChanged(self, row):
+        # Switching to a known serial shows that gauge's stored calibration
+        serial = row["serial"].text().strip()
+        if serial in self.store.gauges:
+            calibration = self.store.get(serial)
+            row["offset"].setText(str(calibration.offset))
+            row["gain"].setText(str(calibration.gain))
+            row["curve"] = calibration.curve
+            self.updateCurveButton(row)
+
+    def curveClicked(self, row):
+        if row["curve"]:
+            row["curve"] = None
+        else:
+            file_name, _ = QFileDialog.getOpenFileName(self, "Load Calibration Curve", "", "CSV Files (*.csv);;All Files (*)")
+            if not file_name:
+                return
+            curve = []
+            with open(file_name, newline="") as file:
+                for line in csv.reader(file):
+                    try:
+                        curve.append((float(line[0]), float(line[1])))
+                    except (ValueError, IndexError):
+                        continue  # Header or malformed row
+            row["curve"] = curve if len(curve) >= 2 else None
+        self.updateCurveButton(row)
+
+    def accept(self):
+        serials = []
+        for row in self.rows:
+            serial = row["serial"].text().strip()
+            serials.append(serial)
+            try:
+                self.store.set(GaugeCalibration(serial, float(row["offset"].text()), float(row["gain"].text()), row["curve"]))
+            except ValueError:
+                continue
+        self.settings["gauges"] = serials + self.settings["gauges"][len(serials):]
+        saveSettings(self.settings)
+        self.store.save()
+        super().accept()
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.pressure = []
-        self.currentDataUnit = "unit"
+        self.log = None
+        self.lastBlock = None
+        self.recorder = None
+        self.activeAlarms = []
+        self.restartAfterError = False
         self.timeElapsed = 0
         self.dataRecordRate = 1  #Default
         self.graph_window = None
+        self.spectrum_window = None
+        self.leak_window = None
         self.setWindowTitle("Pressure Reader")
         self.setGeometry(100, 100, 300, 300)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowMaximizeButtonHint)
         self.setWindowIcon(QIcon(os.path.join(basedir, "icon.png")))
 
-        instruction_text = "<span style='font-size: 10pt;'><b>Instructions</b><br>Connect Signal pin of the senor to the NIDAQ AI.<br>Data acquire time should be a factor of recording interval. <br> Changing the unit while running will corrupt the recorded data."
+        instruction_text = "<span style='font-size: 10pt;'><b>Instructions</b><br>Connect Signal pin of the senor to the NIDAQ AI.<br>Data acquire time should be a factor of recording interval."
         self.instruction = QLabel(instruction_text, self)
         self.instruction.setSizePolicy(QSizePolicy.Expanding,QSizePolicy.Fixed)
         # self.instruction.setStyleSheet("background-color: blue;")
@@ -278,6 +537,12 @@ class MainWindow(QMainWindow):
         self.plot_button.clicked.connect(self.plotClicked)
         # self.plot_button.setEnabled(False)
 
+        self.spectrum_button = QPushButton("Spectrum", self)
+        self.spectrum_button.clicked.connect(self.spectrumClicked)
+
+        self.leak_button = QPushButton("Leak Rate", self)
+        self.leak_button.clicked.connect(self.leakClicked)
+
         self.export_button = QPushButton("Export Data", self)
         self.export_button.clicked.connect(self.exportClicked)
         # self.export_button.setEnabled(False)
@@ -289,6 +554,21 @@ class MainWindow(QMainWindow):
         self.remove_sensor_button.clicked.connect(self.removeClicked)
         self.remove_sensor_button.setEnabled(False)
 
+        self.alarm_button = QPushButton("Alarm Settings", self)
+        self.alarm_button.clicked.connect(self.alarmClicked)
+
+        self.calibration_button = QPushButton("Calibration", self)
+        self.calibration_button.clicked.connect(self.calibrationClicked)
+
+        self.metrics_button = QPushButton("Metrics", self)
+        self.metrics_button.clicked.connect(self.metricsClicked)
+
+        self.interlock_label = QLabel("Interlock: off", self)
+        self.interlock_label.setSizePolicy(QSizePolicy.Expanding,QSizePolicy.Fixed)
+        self.interlock_reset_button = QPushButton("Reset Interlock", self)
+        self.interlock_reset_button.clicked.connect(self.interlockResetClicked)
+        self.interlock_reset_button.setEnabled(False)
+
         self.sampling_rate_label = QLabel("Sampling Rate (Hz)", self)
         self.sampling_rate_label.setSizePolicy(QSizePolicy.Expanding,QSizePolicy.Fixed)
         self.sampling_rate_edit = QLineEdit(self)
@@ -310,6 +590,11 @@ class MainWindow(QMainWindow):
         self.data_record_rate_edit.setPlaceholderText("Enter data record interval")
         self.data_record_rate_edit.setValidator(QIntValidator())
 
+        # What the device can do with these settings and what the run will cost
+        self.plan_label = QLabel("", self)
+        self.plan_label.setWordWrap(True)
+        self.plan_label.setSizePolicy(QSizePolicy.Expanding,QSizePolicy.Fixed)
+
         self.separator1 = QFrame(self)
         self.separator1.setFrameShape(QFrame.HLine)
         self.separator1.setFrameShadow(QFrame.Sunken)
@@ -330,6 +615,7 @@ class MainWindow(QMainWindow):
         self.radio_group.addButton(self.radio_mbar, id=0)
         self.radio_group.addButton(self.radio_torr, id=1)
         self.radio_group.addButton(self.radio_pascal, id=2)
+        self.radio_group.buttonClicked.connect(self.unitChanged)
         self.radio_mbar.setChecked(True)  # Set default checked button
 
         hlayout = QHBoxLayout()
@@ -345,7 +631,18 @@ class MainWindow(QMainWindow):
         self.device_label.setSizePolicy(QSizePolicy.Expanding,QSizePolicy.Fixed)
         self.device_dropdown = QComboBox(self)
         self.refresh_button = QPushButton("Refresh", self)
-        self.refresh_button.clicked.connect(self.refresh_devices)
+        self.devices = {}
+        self.device_watcher = DeviceWatcher()
+        self.device_watcher.devices_changed.connect(self.showDevices)
+        self.discovery = DeviceDiscovery(self.device_watcher.devices_changed.emit, loadSettings()["devices"]["poll_interval"])
+        self.refresh_button.clicked.connect(self.discovery.refresh)
+        self.device_dropdown.currentTextChanged.connect(lambda: self.updatePlan())
+        self.sampling_rate_edit.textChanged.connect(lambda: self.updatePlan())
+        self.data_fetch_rate_edit.textChanged.connect(lambda: self.updatePlan())
+        # Read again on Start, so the plan does not go to disk on every keystroke
+        self.planSettings = loadSettings()
+        self.plan_watcher = PlanWatcher()
+        self.plan_watcher.cost_measured.connect(self.updatePlan)
 
         self.mainLayout = QVBoxLayout()
 
@@ -367,6 +664,7 @@ class MainWindow(QMainWindow):
         self.mainLayout.addSpacing(10)
         self.mainLayout.addWidget(self.data_record_rate_label)
         self.mainLayout.addWidget(self.data_record_rate_edit)
+        self.mainLayout.addWidget(self.plan_label)
         self.mainLayout.addLayout(hlayout)
 
 
@@ -377,6 +675,8 @@ class MainWindow(QMainWindow):
         buttonLayoutTop.addWidget(self.start_button)
         buttonLayoutTop.addWidget(self.stop_button)
         buttonLayoutMiddle.addWidget(self.plot_button)
+        buttonLayoutMiddle.addWidget(self.spectrum_button)
+        buttonLayoutMiddle.addWidget(self.leak_button)
         buttonLayoutMiddle.addWidget(self.export_button)
         buttonLayoutBottom.addWidget(self.add_sensor_button)
         buttonLayoutBottom.addWidget(self.remove_sensor_button)
@@ -384,6 +684,15 @@ class MainWindow(QMainWindow):
         self.mainLayout.addLayout(buttonLayoutTop)
         self.mainLayout.addLayout(buttonLayoutMiddle)
         self.mainLayout.addLayout(buttonLayoutBottom)
+        settingsLayout = QHBoxLayout()
+        settingsLayout.addWidget(self.alarm_button)
+        settingsLayout.addWidget(self.calibration_button)
+        settingsLayout.addWidget(self.metrics_button)
+        self.mainLayout.addLayout(settingsLayout)
+        interlockLayout = QHBoxLayout()
+        interlockLayout.addWidget(self.interlock_label)
+        interlockLayout.addWidget(self.interlock_reset_button)
+        self.mainLayout.addLayout(interlockLayout)
         self.mainLayout.addSpacing(10)
         self.mainLayout.addWidget(self.separator2)
         self.mainLayout.addSpacing(10)
@@ -404,10 +713,36 @@ class MainWindow(QMainWindow):
         self.reader.moveToThread(self.reader_thread)
         self.reader_thread.started.connect(self.reader.run)
         self.reader.data_ready.connect(self.updateUI)
+        self.reader.alarm_changed.connect(self.alarmChanged)
+        self.reader.interlock_tripped.connect(self.interlockTripped)
+        self.reader.spectrum_ready.connect(self.updateSpectrum)
         self.reader.error_occurred.connect(self.errorHandler)
 
+        self.server = ReadingServer.fromSettings(loadSettings()["server"])
+        if self.server is not None:
+            self.server.start()
+            self.reader.server = self.server
+        self.history = HistoryStore.fromSettings(loadSettings()["history"])
+        if self.history is not None:
+            try:
+                self.history.start()
+                self.reader.history = self.history
+            except (OSError, sqlite3.Error) as e:
+                log.warning("History database could not be opened: %s", e)
+                self.history = None
+        try:
+            self.metrics_server = MetricsServer.fromSettings(loadSettings()["metrics"])
+        except OSError as e:
+            log.warning("Metrics endpoint could not start: %s", e)
+            self.metrics_server = None
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+
         QTimer.singleShot(0, self.done)
-        self.refresh_devices()  # Initial device refresh
+        # Devices are listed once discovery has found them, after the window is shown
+        self.setEnabled(False)
+        QTimer.singleShot(0, self.discovery.start)
+        QTimer.singleShot(0, lambda: threading.Thread(target=self.measurePlanCost, name="PlanCost", daemon=True).start())
 
 
         # self.setStyleSheet("background-color: lightblue;")
@@ -448,41 +783,101 @@ class MainWindow(QMainWindow):
             return False
         return True
 
-    def errorHandler(self):
-        print("Error Handler")
+    def errorHandler(self, message):
+        log.warning("Acquisition stopped by an error: %s", message)
+        DAQ_ERRORS.inc()
+        self.restartAfterError = True
         try:
-
-            if self.reader_thread:
-                self.reader_thread.quit()
-                self.reader_thread.wait()
+            # The acquisition process has already stopped, this waits for the reader thread
+            self.stopClicked()
 
             msg_box = QMessageBox(self)
             # msg_box.setMinimumSize(400)
             msg_box.setIcon(QMessageBox.Critical)
             msg_box.setWindowTitle("Error")
             msg_box.setText("An error occurred")
-            msg_box.setInformativeText("NIDAQ Device Unexpectedly Removed!")
+            msg_box.setInformativeText(message)
             msg_box.setStandardButtons(QMessageBox.Ok)
             msg_box.exec_()
-            self.device_dropdown.setEnabled(True)
-            self.device_label.setEnabled(True)
-            self.refresh_button.setEnabled(True)
-            self.refresh_devices()
+            self.discovery.refresh()
 
-        except Exception as e:
-            print(e)
+        except Exception:
+            log.exception("Error handler failed")
 
 
     def refresh_devices(self):
-        print("Refresh Devices")
-        system = System.local()
-        devices = system.devices
-        device_names = [device.name for device in devices]
-        self.setEnabled(len(device_names)!=0)
+        # Served from the discovery cache, nothing is enumerated here
+        return self.device_dropdown.currentText() in self.devices
+
+    def showDevices(self, devices):
+        log.debug("Devices: %s", [device.name for device in devices])
+        self.devices = {device.name: device for device in devices}
+        selected = self.device_dropdown.currentText()
         self.device_dropdown.clear()
-        self.device_dropdown.addItems(device_names)
+        self.device_dropdown.addItems(list(self.devices))
+        if selected in self.devices:
+            self.device_dropdown.setCurrentText(selected)
+        # While acquiring the controls stay as they are, a removed device shows up as a read error
+        if not self.reader_thread.isRunning():
+            self.setEnabled(len(devices)!=0)
+        self.updatePlan()
 
-        return len(device_names)!=0
+    def measurePlanCost(self):
+        # On its own thread: this imports scipy and runs the pipeline a few times, which
+        # takes about a second. The plan shows no CPU estimate until it is done.
+        try:
+            sampleCost(self.planSettings["filter"])
+        except Exception:
+            log.exception("The pipeline cost could not be measured")
+            return
+        self.plan_watcher.cost_measured.emit()
+
+    def makePlan(self):
+        # None while the rate fields do not hold numbers
+        try:
+            samplingRate = int(self.sampling_rate_edit.text())
+            readRate = float(self.data_fetch_rate_edit.text())
+        except ValueError:
+            return None
+        return planAcquisition(self.devices.get(self.device_dropdown.currentText()), len(self.pressureSection),
+                               samplingRate, readRate, self.planSettings, measure=False)
+
+    def updatePlan(self):
+        plan = self.makePlan()
+        if plan is None:
+            self.plan_label.setText("")
+            return
+        lines = []
+        if plan.maxRate is not None:
+            lines.append(f"Up to {plan.maxRate:.0f} Hz per channel with {len(self.pressureSection)} sensor(s)")
+        if plan.nr_samples:
+            text = f"Blocks of {plan.nr_samples} samples, buffer of {plan.bufferSamples} samples, about {plan.memoryBytes / 1e6:.0f} MB"
+            if plan.cpuLoad is not None:
+                text += f" and {plan.cpuLoad * 100:.2g} % of a CPU core"
+            lines.append(text)
+        lines += plan.errors + plan.warnings
+        if plan.samplingRate is not None:
+            lines.append(f"Proposed sampling rate: {plan.samplingRate} Hz")
+        self.plan_label.setText("\n".join(lines))
+        self.plan_label.setStyleSheet("color: red;" if plan.errors else "")
+        self.plan_label.setToolTip(f"The device buffer holds {plan.fifoSeconds * 1000:.0f} ms of samples"
+                                   if plan.fifoSeconds is not None else "")
+
+    def applyPlan(self, plan):
+        # Switches to the proposed sampling rate, asking first unless auto_plan is set;
+        # False when the settings cannot run as they are
+        if plan.samplingRate is None:
+            QMessageBox.warning(self, "Acquisition Settings", "\n".join(plan.errors))
+            return False
+        if not loadSettings()["acquisition"].get("auto_plan"):
+            reply = QMessageBox.question(self, "Acquisition Settings", "\n".join(plan.errors) + f"\n\nUse {plan.samplingRate} Hz instead?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply != QMessageBox.Yes:
+                return False
+        log.info("Sampling rate changed from %s Hz to %s Hz: %s", self.samplingRate, plan.samplingRate, "; ".join(plan.errors))
+        self.sampling_rate_edit.setText(str(plan.samplingRate))
+        self.samplingRate = plan.samplingRate
+        return True
 
     def setEnabled(self, enable):
         if not DEBUG:
@@ -496,19 +891,24 @@ class MainWindow(QMainWindow):
             self.radio_mbar.setEnabled(enable)
             self.radio_torr.setEnabled(enable)
             self.radio_pascal.setEnabled(enable)
-            self.pressureValueLabel.setEnabled(enable)
-            self.pressureLabel.setEnabled(enable)
+            for pressureLabel, pressureValueLabel in self.pressureSection:
+                pressureLabel.setEnabled(enable)
+                pressureValueLabel.setEnabled(enable)
             self.export_button.setEnabled(enable)
             self.plot_button.setEnabled(enable)
             self.add_sensor_button.setEnabled(enable)
-            self.remove_sensor_button.setEnabled(enable)
+            self.remove_sensor_button.setEnabled(enable and len(self.pressureSection) > 1)
 
 
     def stopClicked(self):
-        print("Stop Clicked")
+        log.info("Stop Clicked")
         self.reader.stop()
         self.reader_thread.quit()
         self.reader_thread.wait()
+        self.closePipeline()
+        if self.recorder is not None:
+            self.recordRows(self.recorder.flush())
+            self.recorder = None
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         self.sampling_rate_edit.setEnabled(True)
@@ -539,18 +939,46 @@ class MainWindow(QMainWindow):
         return False
 
     def startClicked(self):
-        print("Start Clicked")
+        log.info("Start Clicked")
         self.dataRecordRate = int(self.data_record_rate_edit.text())
         self.samplingRate = int(self.sampling_rate_edit.text())
         self.readRate = float(self.data_fetch_rate_edit.text())
         if (not self.refresh_devices() and not DEBUG) or not self.checkData():
             return 0
+        settings = self.planSettings = loadSettings()
+        plan = self.makePlan()
+        if plan.errors:
+            if not self.applyPlan(plan):
+                return 0
+            plan = self.makePlan()
 
-        if len(self.pressure) != 0:
+        if self.log is not None and len(self.log) != 0:
             if self.showWarning():
                 return 0
 
-
+        deviceID = self.device_dropdown.currentText()
+        unit = CANONICAL_UNIT
+        channels = channelsFromSettings(settings["channels"], len(self.pressureSection))
+        info = self.devices.get(deviceID)
+        if info is not None:
+            problems = validateChannels(channels, info)
+            if problems:
+                log.warning("Channel settings do not fit %s: %s", deviceID, "; ".join(problems))
+                QMessageBox.warning(self, "Channel Settings", "The channel settings do not fit " + deviceID + ":\n\n" + "\n".join(problems))
+                return 0
+            for i, channel in enumerate(channels):
+                log.info("AI%d: %s, %s, %g to %g V, device range %s", i, channel.physical, channel.terminal, channel.minVoltage,
+                         channel.maxVoltage, inputRange(channel, info.voltageRanges) if info.voltageRanges else "unknown")
+        # The interlock output itself is created by the acquisition process
+        interlock = Interlock.conditionsFromSettings(settings["interlock"], len(self.pressureSection))
+        alarms = AlarmEngine.fromSettings(len(self.pressureSection), self.readRate, settings["alarms"], unit)
+        serials = settings["gauges"] + [""] * (len(self.pressureSection) - len(settings["gauges"]))
+        lut = CalibrationStore().compile(serials[:len(self.pressureSection)], unit)
+        from filters import StreamingFilter
+        streamFilter = StreamingFilter.fromSettings(len(self.pressureSection), self.samplingRate, settings["filter"])
+        self.interlock_label.setText("Interlock: armed" if interlock else "Interlock: off")
+        self.interlock_label.setStyleSheet("")
+        self.interlock_reset_button.setEnabled(bool(interlock))
 
         self.start_button.setEnabled(False)
         self.sampling_rate_edit.setEnabled(False)
@@ -566,101 +994,247 @@ class MainWindow(QMainWindow):
         self.add_sensor_button.setEnabled(False)
         self.remove_sensor_button.setEnabled(False)
         self.export_button.setEnabled(False)
-        self.enableRadioButtons(False)
 
 
-        self.pressure = [[] for i in range(len(self.pressureSection))]
-        self.currentDataUnit = self.getCurrentPressureUnit()
+        self.log = PressureLog(len(self.pressureSection), unit, time.time())
+        # None records every dataRecordRate as before, otherwise the recorder picks the rows
+        self.recorder = recorderFromSettings(settings["recording"], len(self.pressureSection))
+        self.timeElapsed = 0
+        self.activeAlarms = [set() for i in range(len(self.pressureSection))]
+        for section in self.pressureSection:
+            section[1].setStyleSheet("")
         if self.graph_window is not None:
-            self.graph_window.setYLabel("Pressure (" + self.currentDataUnit + ")")
+            self.graph_window.setUnit(self.getCurrentPressureUnit())
             self.graph_window.clearGraph()
+            self.graph_window.resetPrediction()
+
+        if self.restartAfterError:
+            RECONNECTS.inc()
+            self.restartAfterError = False
 
         if not self.reader_thread.isRunning():
-            deviceID = self.device_dropdown.currentText()
-            print("Sampling Rate:", self.samplingRate)
-            print("Read Rate:", self.readRate)
-            self.reader.setDeviceID(deviceID)
-            self.reader.setSamplingAndReadRate(self.samplingRate, self.readRate, len(self.pressureSection))
+            log.info("Sampling Rate: %s, Read Rate: %s", self.samplingRate, self.readRate)
+            log.info("Plan: %d samples per block, %d samples buffer, about %.0f MB, CPU %s", plan.nr_samples, plan.bufferSamples,
+                     plan.memoryBytes / 1e6, f"{plan.cpuLoad * 100:.2g} %" if plan.cpuLoad is not None else "not measured")
+            self.reader.setConfig(AcquisitionConfig(deviceID, len(self.pressureSection), self.samplingRate, self.readRate, DEBUG,
+                                                    lut, alarms, streamFilter, settings["interlock"], settings["feed"], settings["capture"],
+                                                    unit, settings["acquisition"]["ring_blocks"], logging.getLogger().level, channels,
+                                                    plan.bufferSamples))
+            self.reader.setAnalysisProcesses(settings["analysis"]["processes"])
+            if self.spectrum_window is not None:
+                self.reader.spectrum = WelchEstimator(len(self.pressureSection), self.samplingRate,
+                                                      segmentLength(int(self.readRate * self.samplingRate)))
             self.reader_thread.start()
         self.stop_button.setEnabled(True)
 
     def plotClicked(self):
-        print("Plot Clicked")
+        log.debug("Plot Clicked")
+        from plotwindows import GraphWindow
         self.graph_window = GraphWindow(self)
-        self.graph_window.setYLabel("Pressure (" + self.getCurrentPressureUnit() + ")")
-        t = [i * self.dataRecordRate for i in range(1,len(self.pressure[0])+1)]
-        for i,data in enumerate(self.pressure):
-            self.graph_window.plotData(t, data, GraphWindow.COLORS[i])
+        self.graph_window.setUnit(self.getCurrentPressureUnit())
+        if self.log is not None:
+            t = self.log.elapsedMinutes()
+            for i in range(self.log.nr_sensors):
+                self.graph_window.plotData(t, self.log.series(i, self.graph_window.unit), self.graph_window.COLORS[i])
 
         self.graph_window.addLegend()
+        if self.log is not None:
+            self.graph_window.updatePrediction(self.log)
         self.graph_window.show()
         self.plot_button.setEnabled(False)
 
 
+    def spectrumClicked(self):
+        log.debug("Spectrum Clicked")
+        from plotwindows import SpectrumWindow
+        self.spectrum_window = SpectrumWindow(self)
+        if self.reader_thread.isRunning():
+            self.reader.spectrum = WelchEstimator(self.reader.nr_channels, self.reader.samplingRate, segmentLength(self.reader.nr_samples))
+        self.spectrum_window.show()
+        self.spectrum_button.setEnabled(False)
+
+    def updateSpectrum(self, freqs, psd):
+        if self.spectrum_window is not None:
+            self.spectrum_window.updateSpectrum(freqs, psd)
+
+    def resetSpectrum(self):
+        if self.reader.spectrum is not None:
+            self.reader.spectrum.reset()
+
+    def onSpectrumClosed(self):
+        self.reader.spectrum = None
+        self.spectrum_window = None
+        self.spectrum_button.setEnabled(True)
+
+    def leakClicked(self):
+        log.debug("Leak Rate Clicked")
+        self.leak_window = LeakRateWindow(self, len(self.pressureSection))
+        self.leak_window.show()
+        self.leak_button.setEnabled(False)
+
+    def onLeakClosed(self):
+        self.leak_window = None
+        self.leak_button.setEnabled(True)
+
     def exportClicked(self):
         self.saveData()
 
-    def updateUI(self, data):
-        pressureArray = []
-        for i,j in enumerate(self.pressureSection):
-            pressure = data[i] if DEBUG else self.calculatePressure(data[i])
-            pressureArray.append(pressure)
-            j[1].setText(str(pressure))
+    def updateUI(self, timestamp, data, status):
+        TRACER.end("signal", timestamp)
+        with TRACER.span("updateUI"):
+            self.showBlock(timestamp, data, status)
+
+    def showBlock(self, timestamp, data, status):
+        start = time.perf_counter()
+        BLOCKS_HANDLED.inc()
+        GUI_QUEUE_DEPTH.set(BLOCKS_READ.value - BLOCKS_HANDLED.value)
+        self.lastBlock = (data, status)
+        with TRACER.span("labels"):
+            self.showPressures(data, status)
+
+        if self.leak_window is not None:
+            self.leak_window.addPoint(timestamp, data, status)
+
+        if self.recorder is not None:
+            with TRACER.span("compress"):
+                rows = self.recorder.add(timestamp, data, status)
+            self.recordRows(rows)
+        else:
+            self.timeElapsed += self.readRate
+            if (self.dataRecordRate * (1 if DEBUG else 60))/self.timeElapsed < 1:
+                self.timeElapsed = 0
+                self.recordRows([(timestamp, data, status)])
 
-        self.timeElapsed += self.readRate
-        if (self.dataRecordRate * 1 if DEBUG else 60)/self.timeElapsed < 1:
-            print("Data Recorded")
-            self.timeElapsed = 0
+        GUI_UPDATE_SECONDS.observe(time.perf_counter() - start)
 
-            for i,j in enumerate(pressureArray):
-                self.pressure[i].append(j)
+    def showPressures(self, data, status):
+        shown = convertPressure(data[:len(self.pressureSection)], CANONICAL_UNIT, self.getCurrentPressureUnit())
+        for i,j in enumerate(self.pressureSection):
+            pressure = shown[i]
+            text = str(pressure)
+            if status[i] in (sensorstatus.UNDERRANGE, sensorstatus.OVERRANGE):
+                text = f"{sensorstatus.NAMES[status[i]]} ({pressure})"
+            elif status[i] != sensorstatus.VALID:
+                text = sensorstatus.NAMES[status[i]]
+            if self.activeAlarms[i]:
+                text += f"  ({', '.join(sorted(self.activeAlarms[i])).upper()})"
+            j[1].setText(text)
+
+    def unitChanged(self):
+        # Nothing stored depends on the shown unit, so this only redraws
+        if self.lastBlock is not None and len(self.lastBlock[0]) >= len(self.pressureSection):
+            self.showPressures(*self.lastBlock)
+        if self.graph_window is not None:
+            self.graph_window.setUnit(self.getCurrentPressureUnit())
+            if self.log is not None:
+                self.redrawGraph()
+
+    def recordRows(self, rows):
+        if not rows:
+            return
+        log.debug("Data Recorded (%d rows)", len(rows))
+        for timestamp, pressures, status in rows:
+            self.log.append(timestamp, pressures, status)
+            if self.server is not None:
+                self.server.publish("record", timestamp, pressures, status, self.log.unit)
 
-            if self.graph_window is not None:
-                print(self.pressure)
-                t = [i * self.dataRecordRate for i in range(1,len(self.pressure[0])+1)]
-                # Plot some example data
-                self.graph_window.clearGraph()
-                for i,data in enumerate(self.pressure):
-                    self.graph_window.plotData(t, data, GraphWindow.COLORS[i],i)
+        if self.graph_window is not None:
+            self.redrawGraph()
+
+    def redrawGraph(self):
+        redrawStart = time.perf_counter()
+        t = self.log.elapsedMinutes()
+        self.graph_window.clearGraph()
+        for i in range(self.log.nr_sensors):
+            self.graph_window.plotData(t, self.log.series(i, self.graph_window.unit), self.graph_window.COLORS[i],i)
+        with TRACER.span("prediction"):
+            self.graph_window.updatePrediction(self.log)
+        PLOT_REDRAW_SECONDS.observe(time.perf_counter() - redrawStart)
 
 
     def done(self):
         self.adjustSize()
 
-    def calculatePressure(self, data):
-        U = np.average(data[0])
-        print(U)
-        checked_button = self.radio_group.checkedButton()
-        index = self.radio_group.id(checked_button)
-        D = [11.33, 11.46, 9.333]
-        d = D[index]
-        avPressure = pow(10, 1.667 * U - d)
-        return avPressure
+    def closeEvent(self, event):
+        if self.server is not None:
+            self.server.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.history is not None:
+            self.reader.history = None
+            self.history.stop()
+        TRACER.stop()
+        self.discovery.stop()
+        super().closeEvent(event)
+
+    def alarmChanged(self, events):
+        for event in events:
+            log.warning("Alarm %s %s on AI%d: %s", event.kind, "raised" if event.active else "cleared", event.sensor, event.value)
+            if event.sensor >= len(self.activeAlarms):
+                continue
+            if event.active:
+                self.activeAlarms[event.sensor].add(event.kind)
+            else:
+                self.activeAlarms[event.sensor].discard(event.kind)
+            self.pressureSection[event.sensor][1].setStyleSheet("color: red;" if self.activeAlarms[event.sensor] else "")
+
+    def interlockTripped(self, latency):
+        log.critical("Interlock tripped, latency %.3f ms", latency * 1000)
+        self.interlock_label.setText(f"Interlock: TRIPPED ({latency * 1000:.2f} ms)")
+        self.interlock_label.setStyleSheet("color: red;")
+
+    def interlockResetClicked(self):
+        # Applied by the acquisition process before its next block
+        if not self.reader_thread.isRunning():
+            return
+        self.reader.resetInterlock()
+        self.interlock_label.setText("Interlock: armed")
+        self.interlock_label.setStyleSheet("")
+
+    def closePipeline(self):
+        # The acquisition process closes the interlock output and leaves it in its last
+        # state, so a tripped valve stays closed
+        self.interlock_reset_button.setEnabled(False)
+
+    def alarmClicked(self):
+        dialog = AlarmDialog(self, len(self.pressureSection))
+        dialog.exec_()
+
+    def metricsClicked(self):
+        dialog = MetricsDialog(self)
+        dialog.show()
+
+    def calibrationClicked(self):
+        dialog = CalibrationDialog(self, len(self.pressureSection))
+        dialog.exec_()
 
     def getCurrentPressureUnit(self):
         checked_button = self.radio_group.checkedButton()
         index = self.radio_group.id(checked_button)
-        D = ["mbar", "torr", "pascal"]
-        return D[index]
+        return UNITS[index]
 
     def saveData(self):
-        # Create a DataFrame from the data
-        t = [i * self.dataRecordRate for i in range(1,len(self.pressure[0])+1)]
-        dataDict = {'Time (min)': t}
-        print(self.pressure)
-        for i,data in enumerate(self.pressure):
-            dataDict[f"Pressure Sensor AI{i}({self.currentDataUnit}"] = data
-
-        data = pd.DataFrame(dataDict)
+        if self.log is None:
+            return
 
         # Open file dialog to get save location and filename
         options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getSaveFileName(self, "Save Data as Excel", "", "Excel Files (*.xlsx);;All Files (*)", options=options)
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Data", "", "Excel Files (*.xlsx);;CSV Files (*.csv);;Parquet Files (*.parquet);;"
+                                                   "Pressure Log (*.frglog);;All Files (*)", options=options)
 
-        if file_name:
-            # Save the DataFrame to the specified Excel file
-            data.to_excel(file_name, index=False)
-            print(f"Data saved to {file_name}")
+        if not file_name:
+            return
+
+        # The native log keeps the absolute timestamps and can be queried with PressureLog.open,
+        # the other formats are written in the shown unit
+        from export import exportLog
+        try:
+            file_name = exportLog(self.log, file_name, self.getCurrentPressureUnit())
+        except (OSError, ValueError, ImportError) as e:
+            log.warning("Export to %s failed: %s", file_name, e)
+            QMessageBox.warning(self, "Export", f"The data could not be saved: {e}")
+            return
+        log.info("Data saved to %s", file_name)
 
     def onGraphClosed(self):
         self.graph_window = None
@@ -673,6 +1247,7 @@ class MainWindow(QMainWindow):
 
         if totalSection > 0:
             self.remove_sensor_button.setEnabled(True)
+        self.updatePlan()
 
     def removeClicked(self):
         if len(self.pressureSection) == 2:
@@ -684,14 +1259,19 @@ class MainWindow(QMainWindow):
         item[0].deleteLater()
         item[1].deleteLater()
         self.pressureSection.pop()
+        self.updatePlan()
         QTimer.singleShot(0, self.done)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    setupLogging(loadSettings()["logging"])
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec_())
+    exitCode = app.exec_()
+    stopLogging()
+    sys.exit(exitCode)
 
 #ToDo:
 # ADD LEGEND
@@ -0,0 +1,140 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Counters, gauges and histograms for acquisition health. Updating one is a plain
+# attribute update (plus a bisect for histograms), well under a microsecond, so they
+# can sit on the per block path. Reads for export may see a value mid update from
+# another thread, which is fine for monitoring.
+
+class Counter:
+    TYPE = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + "_total", labels, self.value
+
+
+class Gauge:
+    TYPE = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    TYPE = "histogram"
+    # Seconds, from 100 us to 10 s
+    BUCKETS = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield name + "_bucket", labels + (("le", "+Inf" if bound == float("inf") else repr(bound)),), cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def metric(self, cls, name, help, labels):
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self.lock:
+            family = self.families.setdefault(name, (cls, help, {}))
+            if family[0] is not cls:
+                raise ValueError(f"{name} is already registered as a {family[0].TYPE}")
+            if key not in family[2]:
+                family[2][key] = cls()
+            return family[2][key]
+
+    def counter(self, name, help="", **labels):
+        return self.metric(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self.metric(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", **labels):
+        return self.metric(Histogram, name, help, labels)
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            families = [(name, cls, help, list(metrics.items())) for name, (cls, help, metrics) in sorted(self.families.items())]
+        for name, cls, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {cls.TYPE}")
+            for labels, metric in metrics:
+                for sample, sampleLabels, value in metric.samples(name, labels):
+                    text = ",".join(f'{key}="{value}"' for key, value in sampleLabels)
+                    lines.append(f"{sample}{{{text}}} {value}" if text else f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    # Serves REGISTRY at http://host:port/metrics from a daemon thread
+
+    def __init__(self, host="127.0.0.1", port=9108, registry=REGISTRY):
+        render = registry.render
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+
+    @classmethod
+    def fromSettings(cls, settings):
+        if not settings.get("enabled"):
+            return None
+        return cls(settings.get("host", "127.0.0.1"), settings.get("port", 9108))
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
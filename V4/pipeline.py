@@ -0,0 +1,61 @@
+from collections import namedtuple
+import time
+import numpy as np
+from status import classifyBlock
+from tracing import TRACER
+
+
+BlockResult = namedtuple("BlockResult", ["timestamp", "stream", "voltages", "pressures", "status", "alarms", "trip"])
+
+
+class BlockPipeline:
+    # Reduces one acquired block (channels x samples) to per channel pressures and
+    # runs the per block checks. Kept free of Qt so it can run in any worker.
+
+    def __init__(self, nr_channels, lut, alarms=None, interlock=None, streamFilter=None):
+        self.nr_channels = nr_channels
+        self.lut = lut
+        self.unit = lut.unit
+        self.alarms = alarms
+        self.interlock = interlock
+        self.streamFilter = streamFilter
+
+    def process(self, block, timestamp, readTime=None):
+        # The interlock goes first and works on the raw block, so neither the filter's
+        # compute time nor its group delay adds to its latency
+        trip = None
+        raw = None
+        if self.interlock is not None:
+            with TRACER.span("interlock"):
+                raw = self.reduce(block)
+                trip = self.interlock.check(raw[2], readTime if readTime is not None else time.perf_counter(), raw[1])
+
+        # Everything shown and recorded comes from the decimated stream
+        stream = block
+        if self.streamFilter is not None:
+            with TRACER.span("filter"):
+                stream = self.streamFilter.process(block)
+            if stream.shape[1] == 0:
+                stream = block
+
+        if stream is block and raw is not None:
+            voltages, status, pressures = raw
+        else:
+            with TRACER.span("convert"):
+                voltages, status, pressures = self.reduce(stream)
+
+        events = []
+        if self.alarms is not None:
+            with TRACER.span("alarms"):
+                events = self.alarms.evaluate(pressures, timestamp)
+        return BlockResult(timestamp, stream, voltages, pressures, status, events, trip)
+
+    def reduce(self, data):
+        voltages, status = classifyBlock(data)
+        pressures = self.lut.convert(np.nan_to_num(voltages))
+        pressures[np.isnan(voltages)] = np.nan
+        return voltages, status, pressures
+
+    def close(self):
+        if self.interlock is not None:
+            self.interlock.close()
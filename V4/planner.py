@@ -0,0 +1,132 @@
+import math
+import time
+from collections import namedtuple
+import numpy as np
+from status import classifyBlock
+
+
+# Checks the sampling settings against what the device can do before Start, proposes
+# settings that work and estimates what the run will cost. A multiplexed device shares
+# maxMultiRate between the channels of a task (maxSingleRate with one channel), a
+# simultaneous sampling device gives every channel maxMultiRate. The DAQmx buffer
+# holds buffer_seconds of samples in whole blocks, at least BUFFER_BLOCKS, so the
+# reads can fall that far behind before the buffer overflows. The estimates are for
+# the proposed rate when the requested one cannot run. Memory counts the shared memory
+# ring, the capture and analysis buffers and the DAQmx buffer; CPU is the block
+# pipeline's measured cost per sample times the sample rate, as a fraction of one core.
+# Measuring that cost imports scipy, so the window does it on a background thread.
+
+BUFFER_BLOCKS = 4
+# Reads shorter than this spend more time in per read overhead than in reading
+MIN_READ_TIME = 0.05
+# Above this fraction of one core the acquisition process risks falling behind
+MAX_CPU = 0.5
+# Samples are held in the DAQmx buffer as 16 bit codes
+RAW_SAMPLE_BYTES = 2
+ANALYSIS_SLOTS = 8
+
+# errors are reasons the settings cannot run; samplingRate is then the closest rate
+# that can (None when changing the rate does not help). cpuLoad is None until the
+# pipeline cost has been measured.
+AcquisitionPlan = namedtuple("AcquisitionPlan", ["samplingRate", "maxRate", "nr_samples", "bufferSamples", "memoryBytes",
+                                                 "cpuLoad", "fifoSeconds", "errors", "warnings"])
+
+costs = {}
+
+
+def maxChannelRate(info, nr_channels):
+    # Highest sample rate per channel, None when the device did not report it
+    if info is None or info.maxMultiRate is None:
+        return None
+    if nr_channels == 1 and info.maxSingleRate is not None:
+        return info.maxSingleRate
+    return info.maxMultiRate if info.simultaneous else info.maxMultiRate / nr_channels
+
+
+def fittingRate(rate, readRate, step=-1):
+    # Nearest whole rate from rate, downwards or upwards with step, whose block is a
+    # whole number of samples, None if there is none close by
+    rate = int(rate) if step < 0 else math.ceil(rate)
+    for candidate in range(rate, max(rate + 1000 * step, 0), step):
+        if abs(candidate * readRate - round(candidate * readRate)) < 1e-9:
+            return candidate
+    return None
+
+
+def sampleCost(filterSettings, measure=True):
+    # Seconds of pipeline time per sample, measured once per filter setting on a
+    # synthetic block; None if not measured yet and measure is False
+    key = bool(filterSettings.get("enabled", True))
+    if key not in costs and measure:
+        from calibration import GaugeCalibration, PressureLUT
+        nr_channels, samplingRate, readRate = 4, 40000, 0.5
+        block = np.random.default_rng(0).uniform(2.0, 8.0, (nr_channels, int(samplingRate * readRate)))
+        lut = PressureLUT([GaugeCalibration()] * nr_channels)
+        streamFilter = None
+        if key:
+            from filters import StreamingFilter
+            streamFilter = StreamingFilter.fromSettings(nr_channels, samplingRate, filterSettings)
+        best = math.inf
+        for i in range(3):
+            start = time.perf_counter()
+            stream = streamFilter.process(block) if streamFilter is not None else block
+            voltages, status = classifyBlock(stream if stream.shape[1] else block)
+            lut.convert(voltages)
+            best = min(best, time.perf_counter() - start)
+        costs[key] = best / block.size
+    return costs.get(key)
+
+
+def planAcquisition(info, nr_channels, samplingRate, readRate, settings, measure=True):
+    # settings is the whole loadSettings() dict
+    errors, warnings = [], []
+    proposed = None
+    maxRate = maxChannelRate(info, nr_channels)
+    if maxRate is not None and samplingRate > maxRate:
+        proposed = fittingRate(maxRate, readRate)
+        if nr_channels == 1:
+            mode = "on one channel"
+        else:
+            mode = f"{info.maxMultiRate:g} S/s " + ("on every channel" if info.simultaneous else f"shared by {nr_channels} channels")
+        errors.append(f"{samplingRate} Hz is above the {maxRate:g} Hz per channel of {info.name} ({mode})")
+    if info is not None and info.minRate is not None and samplingRate < info.minRate:
+        proposed = fittingRate(info.minRate, readRate, 1)
+        errors.append(f"{samplingRate} Hz is below the {info.minRate:g} Hz minimum of {info.name}")
+
+    if not errors and abs(readRate * samplingRate - round(readRate * samplingRate)) > 1e-9:
+        proposed = fittingRate(samplingRate, readRate)
+        errors.append(f"{samplingRate} Hz x {readRate:g} s is not a whole number of samples")
+    rate = proposed if proposed is not None else samplingRate
+    nr_samples = int(readRate * rate)
+    if nr_samples < 1:
+        errors.append("The data acquire time holds no sample at this sampling rate")
+        return AcquisitionPlan(proposed, maxRate, 0, 0, 0, None, None, errors, warnings)
+    if readRate < MIN_READ_TIME:
+        warnings.append(f"Reads shorter than {MIN_READ_TIME:g} s spend most of their time in overhead")
+
+    bufferSamples = max(BUFFER_BLOCKS * nr_samples, math.ceil(settings["acquisition"].get("buffer_seconds", 10.0) * rate))
+    bufferSamples = math.ceil(bufferSamples / nr_samples) * nr_samples
+    fifoSeconds = None
+    if info is not None and info.usbTransferBytes:
+        transferTime = info.usbTransferBytes / (RAW_SAMPLE_BYTES * nr_channels * rate)
+        if transferTime > readRate:
+            warnings.append(f"One USB transfer takes {transferTime:.2f} s to fill, reads will arrive in bursts")
+    if info is not None and info.onboardBuffer:
+        # How long the device rides out a bus that does not collect its samples
+        fifoSeconds = info.onboardBuffer / (rate * (nr_channels if not info.simultaneous else 1))
+
+    blockBytes = nr_channels * nr_samples * 8
+    memoryBytes = settings["acquisition"]["ring_blocks"] * blockBytes + bufferSamples * nr_channels * RAW_SAMPLE_BYTES
+    if settings["analysis"].get("processes", 0) > 0:
+        memoryBytes += ANALYSIS_SLOTS * blockBytes
+    capture = settings["capture"]
+    if capture.get("enabled") and capture.get("conditions"):
+        pre = math.ceil(capture.get("pre_seconds", 2.0) / readRate)
+        post = math.ceil(capture.get("post_seconds", 2.0) / readRate)
+        memoryBytes += (pre + 2 * (pre + 1 + post)) * blockBytes
+
+    cost = sampleCost(settings["filter"], measure)
+    cpuLoad = cost * rate * nr_channels if cost is not None else None
+    if cpuLoad is not None and cpuLoad > MAX_CPU:
+        warnings.append(f"The acquisition process would use about {cpuLoad:.0%} of a CPU core")
+    return AcquisitionPlan(proposed, maxRate, nr_samples, bufferSamples, memoryBytes, cpuLoad, fifoSeconds, errors, warnings)
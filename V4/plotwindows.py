@@ -0,0 +1,302 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QAction, QSplitter, QMenuBar, QInputDialog
+from PyQt5.QtCore import Qt
+from pumpdown import PumpDownPredictor
+from gauge import convertPressure
+from config import loadSettings, saveSettings
+from tracing import TRACER
+import status as sensorstatus
+
+
+# Plot windows, kept apart from main.py so pyqtgraph is only imported when one is opened
+
+class GraphWindow(QMainWindow):
+    COLORS = ['r', 'b', 'g', 'y', 'o', 'k']
+    STATUS_MERGED = 0
+    STATUS_SPLIT = 1
+    def __init__(self,parent):
+        super().__init__(parent)
+        self.plotStatus = GraphWindow.STATUS_MERGED
+        self.setWindowTitle("Pressure Graph")
+        self.setGeometry(100, 100, 800, 600)
+
+        # Create a central widget and set the layout
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+
+        self.main_layout = QVBoxLayout(self.central_widget)
+
+        # Create a menu bar
+        self.menu_bar = QMenuBar(self)
+        self.setMenuBar(self.menu_bar)
+
+        # Add a menu and action to split the graph
+        self.view_menu = self.menu_bar.addMenu("View")
+        self.split_action = QAction("Split", self)
+        self.combine_action = QAction("Combine", self)
+        self.split_action.triggered.connect(self.splitGraphs)
+        self.combine_action.triggered.connect(self.combineGraphs)
+        self.view_menu.addAction(self.split_action)
+        self.view_menu.addAction(self.combine_action)
+
+        # Pump-down prediction overlay
+        self.prediction_menu = self.menu_bar.addMenu("Prediction")
+        self.prediction_action = QAction("Show Pump-Down Prediction", self)
+        self.prediction_action.setCheckable(True)
+        self.prediction_action.toggled.connect(self.predictionToggled)
+        self.target_action = QAction("Target Pressure...", self)
+        self.target_action.triggered.connect(self.targetClicked)
+        self.prediction_menu.addAction(self.prediction_action)
+        self.prediction_menu.addAction(self.target_action)
+        self.predictor = None
+        self.prediction = []
+        self.log = None
+        # Rows of self.log the predictor has been given
+        self.fedRows = 0
+        # Target pressure in mbar, saved to the settings when changed
+        self.target = loadSettings()["prediction"]["target_mbar"]
+
+        # Create a layout for the plot widgets
+        self.plot_layout = QVBoxLayout()
+        self.main_layout.addLayout(self.plot_layout)
+
+        # Create a plot widget
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setBackground('w')
+        self.plot_widget.setTitle("Pressure", color="black", size="12pt")
+        self.plot_layout.addWidget(self.plot_widget)
+
+        self.plot_widgets = [self.plot_widget]
+        self.y_unit = "None"
+        self.unit = "mbar"
+        self.combine_action.setEnabled(False)
+
+    def setYLabel(self,ylabel):
+        self.y_unit = ylabel
+
+    def setUnit(self, unit):
+        # Shown unit; the log and the prediction stay in the log's unit
+        self.unit = unit
+        self.setYLabel("Pressure (" + unit + ")")
+        for index in range(len(self.plot_widgets)):
+            self.updateYlabel(index)
+
+    def updateYlabel(self,index = 0):
+        self.plot_widgets[index].setLabel('left', self.y_unit, color='black', size='12pt')
+
+    def xlabel(self, xlabel="Time (min)", index = 0):
+        self.plot_widgets[index].setLabel('bottom', xlabel, color='black', size='12pt')
+
+    def plotData(self, x=None, y=None, color ='r', index = 0, symbol='o', symbolSize=8):
+        if x is None or y is None:
+            x = np.linspace(0, 10, 100)
+            y = np.sin(x)
+        if len(self.plot_widgets)==1:
+            index = 0
+        # Plot the data
+        with TRACER.span("plotData"):
+            self.plot_widgets[index].plot(x, y, pen=pg.mkPen(color=color, width=2), symbol=symbol, symbolSize=symbolSize, symbolBrush=pg.mkBrush(color))
+            self.updateYlabel(index=index)
+            self.xlabel()
+
+    @staticmethod
+    def dataItems(plot_widget):
+        # Plotted data, without the prediction overlay
+        return [item for item in plot_widget.getPlotItem().items if not getattr(item, "overlay", False)]
+
+    def addLegend(self):
+        self.legend = pg.LegendItem((80, 60), offset=(30, 30))
+        self.legend.setParentItem(self.plot_widgets[0].graphicsItem())
+        if len(self.plot_widgets) == 1:
+            for i,plot in enumerate(self.dataItems(self.plot_widgets[0])):
+                self.legend.addItem(plot,f"Senor AI{i}")
+
+    def predictionToggled(self, checked):
+        if checked and self.log is not None:
+            self.updatePrediction(self.log)
+        else:
+            self.drawPrediction()
+
+    def targetClicked(self):
+        unit = self.unit
+        current = float(convertPressure(self.target, "mbar", unit))
+        target, ok = QInputDialog.getText(self, "Target Pressure", f"Target pressure ({unit})", text=f"{current:g}")
+        try:
+            target = float(target)
+        except ValueError:
+            ok = False
+        if ok and target > 0:
+            self.target = float(convertPressure(target, unit, "mbar"))
+            settings = loadSettings()
+            settings["prediction"]["target_mbar"] = self.target
+            saveSettings(settings)
+            if self.log is not None:
+                self.updatePrediction(self.log)
+
+    def resetPrediction(self):
+        self.predictor = None
+        self.fedRows = 0
+        self.prediction = []
+        self.statusBar().clearMessage()
+
+    def updatePrediction(self, log):
+        # Warm started refit of every sensor after a new recorded point. The predictor
+        # keeps the points it was given, so only the rows recorded since are passed on.
+        if log is not self.log:
+            self.resetPrediction()
+        self.log = log
+        if not self.prediction_action.isChecked() or len(log) < 4:
+            self.drawPrediction()
+            return
+
+        if self.predictor is None or len(self.predictor.models) != log.nr_sensors:
+            self.predictor = PumpDownPredictor(log.nr_sensors)
+            self.fedRows = 0
+        t, pressure, status = log.rows(self.fedRows)
+        self.fedRows = len(log)
+        pressure = np.where(status == sensorstatus.VALID, pressure, np.nan)
+        self.predictor.update(t - log.startTime, pressure)
+        now = float(log.times()[-1] - log.startTime)
+
+        target = float(convertPressure(self.target, "mbar", log.unit))
+        shownTarget = float(convertPressure(target, log.unit, self.unit))
+        self.prediction = []
+        messages = []
+        for i in range(log.nr_sensors):
+            curve_t, curve_p, reach = self.predictor.predict(i, now, target)
+            if curve_t is None:
+                continue
+            self.prediction.append((i, curve_t / 60, convertPressure(curve_p, log.unit, self.unit)))
+            if reach is None:
+                messages.append(f"AI{i}: {shownTarget:g} {self.unit} not reached")
+            elif reach <= now:
+                messages.append(f"AI{i}: at {shownTarget:g} {self.unit}")
+            else:
+                messages.append(f"AI{i}: {shownTarget:g} {self.unit} in {(reach - now) / 60:.1f} min")
+        self.statusBar().showMessage("   ".join(messages))
+        self.drawPrediction()
+
+    def drawPrediction(self):
+        for plot_widget in self.plot_widgets:
+            for item in plot_widget.getPlotItem().items[:]:
+                if getattr(item, "overlay", False):
+                    plot_widget.removeItem(item)
+        if not self.prediction_action.isChecked():
+            self.statusBar().clearMessage()
+            return
+
+        for i, t, p in self.prediction:
+            index = i if len(self.plot_widgets) > 1 else 0
+            if index >= len(self.plot_widgets):
+                continue
+            color = GraphWindow.COLORS[i % len(GraphWindow.COLORS)]
+            item = self.plot_widgets[index].plot(t, p, pen=pg.mkPen(color=color, width=2, style=Qt.DashLine))
+            item.overlay = True
+
+
+    def clearGraph(self):
+        for plot in self.plot_widgets:
+            plot.clear()
+
+    def closeEvent(self, event):
+        if hasattr(self.parent(),"onGraphClosed"):
+            self.parent().onGraphClosed()
+        super().closeEvent(event)
+
+    def combineGraphs(self):
+        for i in reversed(range(self.splitter.count())):
+            self.splitter.widget(i).setParent(None)
+        self.splitter.setParent(None)
+        self.splitter = None
+
+        plot_widget = pg.PlotWidget()
+        plot_widget.setBackground('w')
+        plot_widget.setTitle(f"Pressure", color="black", size="12pt")
+        plot_widgets = self.plot_widgets
+        self.plot_widgets = [plot_widget]
+        for i,plot in enumerate(plot_widgets):
+            x, y = self.dataItems(plot)[0].getData()
+            self.plotData(x, y, GraphWindow.COLORS[i])
+
+        self.plot_layout.addWidget(plot_widget)
+        self.updateYlabel()
+        self.xlabel()
+        self.addLegend()
+        self.drawPrediction()
+        self.split_action.setEnabled(True)
+        self.combine_action.setEnabled(False)
+
+
+    def splitGraphs(self):
+
+
+        plot_widget = self.plot_widgets[0]
+        plots = self.dataItems(plot_widget)
+
+        self.splitter = QSplitter(Qt.Vertical)
+        self.plot_widgets = []
+
+        for i in range(len(plots)):
+            plot_widget = pg.PlotWidget()
+            plot_widget.setBackground('w')
+            plot_widget.setTitle(f"Pressure (Sensor AI{i + 1})", color="black", size="12pt")
+
+            self.splitter.addWidget(plot_widget)
+            self.plot_widgets.append(plot_widget)
+            x, y = plots[i].getData()
+            self.plotData(x, y, GraphWindow.COLORS[i], i)
+            self.updateYlabel(i)
+            self.xlabel(index=i)
+
+
+        for i in range(self.plot_layout.count()):
+            self.plot_layout.itemAt(i).widget().setParent(None)
+        self.plot_layout.addWidget(self.splitter)
+        self.drawPrediction()
+        self.split_action.setEnabled(False)
+        self.combine_action.setEnabled(True)
+
+class SpectrumWindow(QMainWindow):
+    def __init__(self,parent):
+        super().__init__(parent)
+        self.setWindowTitle("Noise Spectrum")
+        self.setGeometry(100, 100, 800, 600)
+
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.main_layout = QVBoxLayout(self.central_widget)
+
+        self.menu_bar = QMenuBar(self)
+        self.setMenuBar(self.menu_bar)
+        self.view_menu = self.menu_bar.addMenu("View")
+        self.reset_action = QAction("Reset Average", self)
+        self.reset_action.triggered.connect(self.resetClicked)
+        self.view_menu.addAction(self.reset_action)
+
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setBackground('w')
+        self.plot_widget.setTitle("Power Spectral Density", color="black", size="12pt")
+        self.plot_widget.setLogMode(x=True, y=True)
+        self.plot_widget.setLabel('left', "PSD (V²/Hz)", color='black', size='12pt')
+        self.plot_widget.setLabel('bottom', "Frequency (Hz)", color='black', size='12pt')
+        self.plot_widget.addLegend()
+        self.main_layout.addWidget(self.plot_widget)
+        self.curves = []
+
+    def updateSpectrum(self, freqs, psd):
+        # Curves are created once and then only get new data, the DC bin is left out of the log axis
+        while len(self.curves) < len(psd):
+            color = GraphWindow.COLORS[len(self.curves) % len(GraphWindow.COLORS)]
+            self.curves.append(self.plot_widget.plot(pen=pg.mkPen(color=color, width=1), name=f"Sensor AI{len(self.curves)}"))
+        for curve, channel in zip(self.curves, psd):
+            curve.setData(freqs[1:], channel[1:])
+
+    def resetClicked(self):
+        if hasattr(self.parent(),"resetSpectrum"):
+            self.parent().resetSpectrum()
+
+    def closeEvent(self, event):
+        if hasattr(self.parent(),"onSpectrumClosed"):
+            self.parent().onSpectrumClosed()
+        super().closeEvent(event)
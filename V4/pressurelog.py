@@ -0,0 +1,174 @@
+import bisect
+import os
+import struct
+import numpy as np
+from gauge import convertPressure
+
+
+# Native run log: a fixed header followed by fixed size records of
+# (float64 timestamp, float64 pressure per sensor, uint8 status per sensor). Timestamps are absolute
+# (seconds since the epoch) and always increasing, so a time range maps to a
+# record range with a binary search. A sparse index keeps the timestamp of every
+# INDEX_STRIDE-th record, so a lookup only touches one chunk of records instead
+# of scanning the whole run. Pressures are stored in one unit (mbar for runs recorded
+# by main.py); reads in another unit are converted on the way out.
+
+class PressureLog:
+    MAGIC = b"FRGLOG2\0"
+    HEADER = struct.Struct("<8sI4x16sd")
+    INDEX_STRIDE = 256
+
+    def __init__(self, nr_sensors, unit="mbar", startTime=None):
+        self.nr_sensors = int(nr_sensors)
+        self.unit = unit
+        self.startTime = startTime
+        self.dtype = np.dtype([("t", "<f8"), ("p", "<f8", (self.nr_sensors,)), ("s", "u1", (self.nr_sensors,))])
+        self.records = np.zeros(1024, dtype=self.dtype)
+        self.count = 0
+        self.index = []
+        # unit -> (converted pressures, records converted so far)
+        self.views = {}
+
+    @classmethod
+    def open(cls, path):
+        # Memory maps a saved log, only the records a query touches are read from disk
+        with open(path, "rb") as file:
+            magic, nr_sensors, unit, startTime = cls.HEADER.unpack(file.read(cls.HEADER.size))
+        if magic != cls.MAGIC:
+            raise ValueError(f"{path} is not a pressure log")
+
+        log = cls(nr_sensors, unit.rstrip(b"\0").decode(), startTime)
+        if os.path.getsize(path) > cls.HEADER.size:
+            log.records = np.memmap(path, dtype=log.dtype, mode="r", offset=cls.HEADER.size)
+        else:
+            log.records = np.zeros(0, dtype=log.dtype)
+        log.count = len(log.records)
+        log.index = log.records["t"][::cls.INDEX_STRIDE].tolist()
+        return log
+
+    @classmethod
+    def fromArrays(cls, times, pressures, status, unit="mbar", startTime=None):
+        # Log of existing records, e.g. synthetic histories; times must be increasing
+        pressures = np.asarray(pressures, dtype=np.float64)
+        log = cls(pressures.shape[1], unit, startTime if startTime is not None else (float(times[0]) if len(times) else None))
+        log.records = np.empty(len(times), dtype=log.dtype)
+        log.records["t"] = times
+        log.records["p"] = pressures
+        log.records["s"] = status
+        log.count = len(times)
+        log.index = log.records["t"][::cls.INDEX_STRIDE].tolist()
+        return log
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.HEADER.pack(self.MAGIC, self.nr_sensors, self.unit.encode()[:16],
+                                        self.startTime if self.startTime is not None else 0.0))
+            self.records[:self.count].tofile(file)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, pressures, status=0):
+        if self.startTime is None:
+            self.startTime = timestamp
+        if self.count == len(self.records):
+            records = np.zeros(2 * len(self.records), dtype=self.dtype)
+            records[:self.count] = self.records[:self.count]
+            self.records = records
+
+        if self.count % self.INDEX_STRIDE == 0:
+            self.index.append(timestamp)
+        self.records[self.count] = (timestamp, pressures, status)
+        self.count += 1
+
+    def times(self):
+        return self.records["t"][:self.count]
+
+    def pressures(self, unit=None):
+        # All pressures in unit. Records are only ever appended, so each one is converted
+        # once per unit and a redraw only converts what was added since the last one.
+        if unit is None or unit == self.unit:
+            return self.records["p"][:self.count]
+        view, converted = self.views.get(unit, (np.zeros((0, self.nr_sensors)), 0))
+        if len(view) < self.count:
+            grown = np.empty((max(self.count, 2 * len(view)), self.nr_sensors))
+            grown[:converted] = view[:converted]
+            view = grown
+        view[converted:self.count] = convertPressure(self.records["p"][converted:self.count], self.unit, unit)
+        self.views[unit] = (view, self.count)
+        return view[:self.count]
+
+    def series(self, sensor, unit=None):
+        return self.pressures(unit)[:, sensor]
+
+    def statusSeries(self, sensor):
+        return self.records["s"][:self.count, sensor]
+
+    def elapsedMinutes(self, times=None):
+        times = self.times() if times is None else times
+        return (times - self.startTime) / 60 if self.startTime is not None else times
+
+    def locate(self, start=None, end=None):
+        # Record range [lo, hi) with start <= t <= end
+        lo = 0 if start is None else self.search(toTimestamp(start), "left")
+        hi = self.count if end is None else self.search(toTimestamp(end), "right")
+        return lo, max(lo, hi)
+
+    def search(self, timestamp, side):
+        if side == "left":
+            chunk = bisect.bisect_left(self.index, timestamp) - 1
+        else:
+            chunk = bisect.bisect_right(self.index, timestamp) - 1
+        if chunk < 0:
+            return 0
+
+        base = chunk * self.INDEX_STRIDE
+        times = self.records["t"][base:min(base + self.INDEX_STRIDE, self.count)]
+        return base + int(np.searchsorted(times, timestamp, side=side))
+
+    def read(self, start=None, end=None, unit=None):
+        lo, hi = self.locate(start, end)
+        chunk = self.records[lo:hi]
+        return np.array(chunk["t"]), np.array(self.pressures(unit)[lo:hi]), np.array(chunk["s"])
+
+    def rows(self, lo, hi=None, unit=None):
+        # Records lo..hi by position, e.g. the ones appended since an earlier count
+        hi = self.count if hi is None else min(hi, self.count)
+        chunk = self.records[lo:hi]
+        return np.array(chunk["t"]), np.array(self.pressures(unit)[lo:hi]), np.array(chunk["s"])
+
+    def query(self, sensor, start=None, end=None, bucket=None, how="mean", unit=None):
+        # Time and pressure of one sensor between start and end, optionally reduced
+        # to one point per bucket (seconds) with how = mean, min, max or count.
+        # Points without a pressure (sensor error, no signal) are left out of buckets.
+        lo, hi = self.locate(start, end)
+        chunk = self.records[lo:hi]
+        t = np.array(chunk["t"])
+        y = np.array(self.pressures(unit)[lo:hi, sensor])
+        if bucket is None or len(t) == 0:
+            return t, y
+
+        origin = toTimestamp(start) if start is not None else t[0]
+        ids = np.floor((t - origin) / bucket)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+        finite = np.isfinite(y)
+        counts = np.add.reduceat(finite.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if how == "mean":
+                y = np.add.reduceat(np.where(finite, y, 0.0), starts) / counts
+            elif how == "min":
+                y = np.fmin.reduceat(y, starts)
+            elif how == "max":
+                y = np.fmax.reduceat(y, starts)
+            elif how == "count":
+                y = counts.astype(np.float64)
+            else:
+                raise ValueError(f"Unknown aggregate {how}")
+        return origin + ids[starts] * bucket, y
+
+
+def toTimestamp(value):
+    # Accepts epoch seconds or datetime objects
+    if hasattr(value, "timestamp"):
+        return value.timestamp()
+    return float(value)
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+LN10 = np.log(10.0)
+
+
+class PumpDownModel:
+    # log10 p(t) = log10(a exp(-t / tau) + b t^-alpha): a volume pumping term and an
+    # outgassing power law. Parameters are (ln a, ln tau, ln b, alpha) so a, tau and b
+    # stay positive. Each fit continues from the previous parameters with a few
+    # Levenberg-Marquardt steps, so updating after a new point is cheap.
+
+    def __init__(self):
+        self.params = None
+        self.damping = 1e-2
+
+    @staticmethod
+    def terms(t, params):
+        lnA, lnTau, lnB, alpha = params
+        volume = np.exp(lnA - t / np.exp(lnTau))
+        outgassing = np.exp(lnB - alpha * np.log(t))
+        return volume, outgassing
+
+    def evaluate(self, t, params=None):
+        volume, outgassing = self.terms(np.asarray(t, dtype=np.float64), self.params if params is None else params)
+        with np.errstate(divide="ignore"):
+            return np.log10(volume + outgassing)
+
+    def initialGuess(self, t, logp):
+        # Volume term starts at the first reading, outgassing with alpha = 1 ends at the last
+        lnA = logp[0] * LN10
+        lnTau = np.log(max((t[-1] - t[0]) / 5, 1.0))
+        lnB = logp[-1] * LN10 + np.log(t[-1])
+        return np.array([lnA, lnTau, lnB, 1.0])
+
+    def fit(self, t, logp, iterations=5):
+        if len(t) < 4:
+            return self.params
+        if self.params is None or not np.all(np.isfinite(self.params)):
+            self.params = self.initialGuess(t, logp)
+            iterations *= 4
+
+        params = self.params
+        cost = np.sum((self.evaluate(t, params) - logp) ** 2)
+        for i in range(iterations):
+            volume, outgassing = self.terms(t, params)
+            p = (volume + outgassing) * LN10
+            residual = np.log10((volume + outgassing)) - logp
+            jacobian = np.stack([volume / p, volume * t / np.exp(params[1]) / p,
+                                 outgassing / p, -outgassing * np.log(t) / p], axis=1)
+            jtj = jacobian.T @ jacobian
+            if not (np.all(np.isfinite(jtj)) and np.all(np.isfinite(residual))):
+                # Overflowing terms far from the data; damp harder like a rejected step
+                self.damping = min(self.damping * 5, 1e7)
+                continue
+            try:
+                step = np.linalg.lstsq(jtj + self.damping * np.diag(np.diag(jtj) + 1e-12), -jacobian.T @ residual, rcond=None)[0]
+            except np.linalg.LinAlgError:
+                self.damping = min(self.damping * 5, 1e7)
+                continue
+            candidate = params + step
+            with np.errstate(over="ignore", invalid="ignore"):
+                candidateCost = np.sum((self.evaluate(t, candidate) - logp) ** 2)
+            if np.isfinite(candidateCost) and candidateCost < cost:
+                params, cost = candidate, candidateCost
+                self.damping = max(self.damping / 3, 1e-7)
+            else:
+                self.damping = min(self.damping * 5, 1e7)
+        self.params = params
+        return params
+
+    def timeToReach(self, logTarget, now, horizon=1e4):
+        # First time after `now` the model reaches the target, searched over
+        # now .. now * horizon in log time; None if it does not get there
+        if self.params is None or self.evaluate(now) <= logTarget:
+            return None if self.params is None else now
+        lo, hi = np.log(now), np.log(now * horizon)
+        if self.evaluate(np.exp(hi)) > logTarget:
+            return None
+        for i in range(60):
+            mid = (lo + hi) / 2
+            if self.evaluate(np.exp(mid)) > logTarget:
+                lo = mid
+            else:
+                hi = mid
+        return float(np.exp(hi))
+
+
+class PumpDownPredictor:
+    # One model per sensor, fitted to the valid part of the recorded series. Points are
+    # kept here as they are added, so a refit only needs the new rows. Long series are
+    # thinned to at most maxPoints, spaced evenly in log time like the pump-down.
+
+    def __init__(self, nr_sensors, maxPoints=400):
+        self.models = [PumpDownModel() for i in range(nr_sensors)]
+        self.maxPoints = maxPoints
+        self.times = [np.empty(0) for i in range(nr_sensors)]
+        self.logPressures = [np.empty(0) for i in range(nr_sensors)]
+        self.counts = [0] * nr_sensors
+
+    def add(self, elapsed, pressures):
+        # New rows only: elapsed in seconds since the start of the run, pressures is (rows, sensors)
+        for i in range(len(self.models)):
+            valid = np.isfinite(pressures[:, i]) & (pressures[:, i] > 0) & (elapsed > 0)
+            t = elapsed[valid]
+            count = self.counts[i]
+            if count + len(t) > len(self.times[i]):
+                size = max(2 * len(self.times[i]), count + len(t), 64)
+                times, logPressures = np.empty(size), np.empty(size)
+                times[:count] = self.times[i][:count]
+                logPressures[:count] = self.logPressures[i][:count]
+                self.times[i], self.logPressures[i] = times, logPressures
+            self.times[i][count:count + len(t)] = t
+            self.logPressures[i][count:count + len(t)] = np.log10(pressures[valid, i])
+            self.counts[i] = count + len(t)
+
+    def update(self, elapsed, pressures):
+        # Adds the rows recorded since the last update and refits every model
+        self.add(elapsed, pressures)
+        for i, model in enumerate(self.models):
+            t = self.times[i][:self.counts[i]]
+            logp = self.logPressures[i][:self.counts[i]]
+            if len(t) > self.maxPoints:
+                index = np.unique(np.geomspace(1, len(t), self.maxPoints).astype(np.intp) - 1)
+                t, logp = t[index], logp[index]
+            model.fit(t, logp)
+
+    def predict(self, sensor, now, target, points=200):
+        # Predicted curve from now until the target is reached (or 10x now if it is not)
+        # and the time at which it is reached, all in seconds since the start of the run
+        model = self.models[sensor]
+        if model.params is None:
+            return None, None, None
+        reach = model.timeToReach(np.log10(target), now)
+        end = reach if reach is not None and reach > now else now * 10
+        t = np.geomspace(now, max(end, now * 1.01), points)
+        return t, 10 ** model.evaluate(t), reach
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import math
+import struct
+import threading
+import numpy as np
+from metrics import REGISTRY
+
+
+# Live readings over TCP. Clients receive newline delimited JSON frames by default:
+#   {"type": "block" | "record", "t": epoch seconds, "unit": "mbar", "p": [...], "s": [...]}
+# and can send a JSON line at any time to change their subscription:
+#   {"format": "json" | "binary", "streams": ["block", "record"], "decimate": 10}
+# Binary frames are a little endian header (uint32 frame length, uint8 type 0 = block
+# 1 = record, uint8 reserved, uint16 channels, float64 timestamp) followed by one
+# float64 pressure and then one uint8 status per channel.
+# Every client has a bounded send queue; a client that falls that far behind is
+# disconnected so it can never hold up acquisition or the other clients.
+
+FRAME_HEADER = struct.Struct("<IBBHd")
+STREAMS = {"block": 0, "record": 1}
+
+log = logging.getLogger(__name__)
+
+CLIENTS = REGISTRY.gauge("stream_clients", "Connected streaming clients")
+CLIENTS_DROPPED = REGISTRY.counter("stream_clients_dropped", "Streaming clients disconnected for falling behind")
+
+
+class Client:
+    def __init__(self, writer, queueSize):
+        self.writer = writer
+        self.queue = asyncio.Queue(queueSize)
+        self.format = "json"
+        self.streams = set(STREAMS)
+        self.decimate = 1
+        self.counters = dict.fromkeys(STREAMS, 0)
+
+    def subscribe(self, request):
+        if request.get("format") in ("json", "binary"):
+            self.format = request["format"]
+        if isinstance(request.get("streams"), list):
+            self.streams = set(request["streams"]) & set(STREAMS)
+        if "decimate" in request:
+            self.decimate = max(1, int(request["decimate"]))
+
+    def wants(self, kind):
+        if kind not in self.streams:
+            return False
+        self.counters[kind] += 1
+        return (self.counters[kind] - 1) % self.decimate == 0
+
+
+class ReadingServer:
+    def __init__(self, host="127.0.0.1", port=5025, queueSize=64):
+        self.host = host
+        self.port = port
+        self.queueSize = queueSize
+        self.clients = set()
+        self.loop = None
+        self.thread = None
+        self.dropped = 0
+        self.ready = threading.Event()
+
+    @classmethod
+    def fromSettings(cls, settings):
+        if not settings.get("enabled"):
+            return None
+        return cls(settings.get("host", "127.0.0.1"), settings.get("port", 5025), settings.get("queue", 64))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ReadingServer", daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handleClient, self.host, self.port))
+        except OSError as e:
+            log.warning("Reading server could not start: %s", e)
+            self.loop = None
+            self.ready.set()
+            return
+        self.ready.set()
+        self.loop.run_forever()
+
+        self.server.close()
+        for client in list(self.clients):
+            self.disconnect(client)
+        # Closed connections end their handlers, anything still running after that is cancelled
+        tasks = asyncio.all_tasks(self.loop)
+        if tasks:
+            self.loop.run_until_complete(asyncio.wait(tasks, timeout=1))
+        for task in tasks:
+            task.cancel()
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+            self.loop = None
+
+    def publish(self, kind, timestamp, pressures, status, unit):
+        # Safe to call from any thread, encoding and sending happen on the server loop
+        if self.loop is not None and self.clients:
+            self.loop.call_soon_threadsafe(self.broadcast, kind, timestamp, np.array(pressures, dtype=np.float64),
+                                           np.array(status, dtype=np.uint8), unit)
+
+    def broadcast(self, kind, timestamp, pressures, status, unit):
+        frames = {}
+        for client in list(self.clients):
+            if not client.wants(kind):
+                continue
+            if client.format not in frames:
+                frames[client.format] = self.encode(client.format, kind, timestamp, pressures, status, unit)
+            try:
+                client.queue.put_nowait(frames[client.format])
+            except asyncio.QueueFull:
+                self.dropped += 1
+                CLIENTS_DROPPED.inc()
+                self.disconnect(client)
+
+    @staticmethod
+    def encode(format, kind, timestamp, pressures, status, unit):
+        if format == "binary":
+            body = pressures.astype("<f8").tobytes() + status.tobytes()
+            return FRAME_HEADER.pack(FRAME_HEADER.size + len(body), STREAMS[kind], 0, len(pressures), timestamp) + body
+        values = [None if math.isnan(p) else p for p in pressures.tolist()]
+        frame = {"type": kind, "t": timestamp, "unit": unit, "p": values, "s": status.tolist()}
+        return (json.dumps(frame) + "\n").encode()
+
+    def disconnect(self, client):
+        if client in self.clients:
+            self.clients.discard(client)
+            CLIENTS.set(len(self.clients))
+            if not client.queue.full():
+                client.queue.put_nowait(None)
+            client.writer.close()
+
+    async def handleClient(self, reader, writer):
+        client = Client(writer, self.queueSize)
+        self.clients.add(client)
+        CLIENTS.set(len(self.clients))
+        sender = asyncio.ensure_future(self.sendFrames(client))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    client.subscribe(json.loads(line))
+                except (ValueError, AttributeError, TypeError):
+                    continue
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.disconnect(client)
+            sender.cancel()
+
+    async def sendFrames(self, client):
+        try:
+            while True:
+                frame = await client.queue.get()
+                if frame is None:
+                    break
+                client.writer.write(frame)
+                await client.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.disconnect(client)
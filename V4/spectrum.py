@@ -0,0 +1,90 @@
+import numpy as np
+
+
+# numpy 2 can write the FFT into a preallocated array
+RFFT_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+
+# Longest segment and the shortest that still resolves something useful
+NPERSEG = 8192
+MIN_NPERSEG = 16
+
+
+def segmentLength(blockLength, nperseg=NPERSEG):
+    # Largest power of two up to nperseg that fits in one block, so short blocks
+    # (10 kHz x 0.5 s) still give a spectrum, at a coarser frequency resolution
+    return max(min(nperseg, 1 << (max(blockLength, 1).bit_length() - 1)), MIN_NPERSEG)
+
+
+class WelchEstimator:
+    # Incremental Welch PSD per channel. Every block contributes a fixed number of Hann
+    # windowed segments spread over the block, transformed in one batched FFT into
+    # reused buffers. Block estimates are averaged cumulatively up to `averages` blocks
+    # and exponentially after that, so the cost per block never depends on run length.
+
+    def __init__(self, nr_channels, sampleRate, nperseg=NPERSEG, segments=4, averages=20):
+        self.nr_channels = nr_channels
+        self.sampleRate = sampleRate
+        self.nperseg = nperseg
+        self.nr_segments = segments
+        self.averages = averages
+
+        # Periodic Hann window, scaled so the result is a one-sided density in V^2/Hz
+        self.window = np.hanning(nperseg + 1)[:-1]
+        self.scale = np.full(nperseg // 2 + 1, 2.0 / (sampleRate * np.sum(self.window ** 2)))
+        self.scale[0] /= 2
+        if nperseg % 2 == 0:
+            self.scale[-1] /= 2
+        self.freqs = np.fft.rfftfreq(nperseg, 1.0 / sampleRate)
+
+        self.segments = np.empty((segments, nr_channels, nperseg))
+        self.spectrum = np.empty((segments, nr_channels, nperseg // 2 + 1), dtype=np.complex128)
+        self.power = np.empty((segments, nr_channels, nperseg // 2 + 1))
+        self.psd = np.zeros((nr_channels, nperseg // 2 + 1))
+        self.count = 0
+
+    def reset(self):
+        self.psd[:] = 0
+        self.count = 0
+
+    def update(self, block):
+        # Returns False when the block is too short for one segment
+        psd = self.blockPsd(block)
+        if psd is None:
+            return False
+        self.accumulate(psd)
+        return True
+
+    def accumulate(self, blockPsd):
+        self.count += 1
+        self.psd += (blockPsd - self.psd) / min(self.count, self.averages)
+
+    def blockPsd(self, block):
+        length = block.shape[1]
+        if length < self.nperseg or block.shape[0] != self.nr_channels:
+            return None
+
+        starts = np.linspace(0, length - self.nperseg, self.nr_segments).astype(np.intp)
+        for i, start in enumerate(starts):
+            segment = block[:, start:start + self.nperseg]
+            np.subtract(segment, segment.mean(axis=1, keepdims=True), out=self.segments[i])
+        self.segments *= self.window
+
+        if RFFT_OUT:
+            np.fft.rfft(self.segments, axis=2, out=self.spectrum)
+        else:
+            self.spectrum[:] = np.fft.rfft(self.segments, axis=2)
+        np.abs(self.spectrum, out=self.power)
+        self.power **= 2
+        return self.power.mean(axis=0) * self.scale
+
+
+# One planned estimator per configuration in each analysis worker process
+_planned = {}
+
+
+def blockSpectrum(block, sampleRate, nperseg, segments):
+    key = (block.shape[0], sampleRate, nperseg, segments)
+    if key not in _planned:
+        _planned[key] = WelchEstimator(*key)
+    return _planned[key].blockPsd(block)
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+VALID = 0
+UNDERRANGE = 1
+OVERRANGE = 2
+SENSOR_ERROR = 3
+OPEN_CIRCUIT = 4
+NAMES = ["OK", "Underrange", "Overrange", "Sensor Error", "No Signal"]
+
+# FRG-700/702 output ranges: 1.82-8.6 V is the measuring range (5e-9 to 1000 mbar),
+# the gauge signals errors below 0.5 V and above 9.5 V, and an unpowered gauge or an
+# unplugged cable leaves the input near 0 V. Each edge belongs to the range above it,
+# so 1.82 V is valid and 8.6 V is overrange.
+VALID_MIN = 1.82
+VALID_MAX = 8.6
+EDGES = np.array([0.3, 0.5, VALID_MIN, VALID_MAX, 9.5])
+CODES = np.array([OPEN_CIRCUIT, SENSOR_ERROR, UNDERRANGE, VALID, OVERRANGE, SENSOR_ERROR], dtype=np.uint8)
+
+# A channel is valid when at least this fraction of its block is in range
+MIN_VALID_FRACTION = 0.5
+
+
+def classifySamples(samples):
+    return CODES[np.searchsorted(EDGES, samples, side="right")]
+
+
+def classifyBlock(block):
+    # Per channel mean voltage over the valid samples only, and the channel status.
+    # The common case is three reductions per channel; only channels with samples out
+    # of the measuring range get masked, and only channels that are mostly out of
+    # range get the full per sample classification.
+    voltages = np.mean(block, axis=1)
+    status = np.zeros(len(block), dtype=np.uint8)
+    clean = (block.min(axis=1) >= VALID_MIN) & (block.max(axis=1) < VALID_MAX)
+    if clean.all():
+        return voltages, status
+
+    for channel in np.flatnonzero(~clean):
+        samples = block[channel]
+        valid = (samples >= VALID_MIN) & (samples < VALID_MAX)
+        count = np.count_nonzero(valid)
+        if count >= MIN_VALID_FRACTION * len(samples):
+            voltages[channel] = samples[valid].mean()
+            continue
+
+        codes = classifySamples(samples)
+        histogram = np.bincount(codes, minlength=len(NAMES))
+        histogram[VALID] = 0
+        status[channel] = np.argmax(histogram)
+        if status[channel] in (UNDERRANGE, OVERRANGE):
+            # Still a usable bound, so report the mean of the out of range samples
+            voltages[channel] = samples[codes == status[channel]].mean()
+        else:
+            voltages[channel] = np.nan
+    return voltages, status
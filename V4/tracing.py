@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+
+# Spans around the acquisition and GUI stages, written as a Chrome trace event file
+# that chrome://tracing and https://ui.perfetto.dev open directly. While tracing is
+# off, span() only checks a flag and hands back a shared no-op context manager.
+# Events are kept as tuples in memory and converted when the trace is written.
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.record("X", self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class Tracer:
+    def __init__(self, maxEvents=1000000):
+        self.enabled = False
+        self.maxEvents = maxEvents
+        self.path = None
+        self.events = []
+        self.threads = {}
+        self.tracks = {}
+        self.origin = 0
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def start(self, path, duration=None):
+        # Records until stop() or, with a duration in seconds, until that has passed
+        with self.lock:
+            if self.enabled:
+                return
+            self.path = path
+            self.events = []
+            self.threads = {}
+            self.tracks = {}
+            self.origin = time.perf_counter_ns()
+            self.enabled = True
+            if duration is not None:
+                self.timer = threading.Timer(duration, self.stop)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def stop(self):
+        # Writes the trace and returns its path, None if nothing was being traced
+        with self.lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            events, threads, path = self.events, self.threads, self.path
+            self.events = []
+        self.write(path, events, threads)
+        return path
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def begin(self, name, id):
+        # Async span that may end on another thread, e.g. a block crossing a signal
+        if self.enabled:
+            self.record("b", name, time.perf_counter_ns(), id)
+
+    def end(self, name, id):
+        if self.enabled:
+            self.record("e", name, time.perf_counter_ns(), id)
+
+    def complete(self, name, start, duration, track):
+        # Span timed elsewhere, e.g. in another process on the same perf_counter clock,
+        # shown on its own named track
+        if self.enabled:
+            tid = self.tracks.setdefault(track, -len(self.tracks) - 1)
+            self.threads[tid] = track
+            if len(self.events) < self.maxEvents:
+                self.events.append(("X", name, start, duration, tid))
+
+    def record(self, phase, name, start, value):
+        # list.append is atomic, so threads do not need the lock here
+        thread = threading.current_thread()
+        if thread.ident not in self.threads:
+            self.threads[thread.ident] = thread.name
+        if len(self.events) < self.maxEvents:
+            self.events.append((phase, name, start, value, thread.ident))
+
+    def write(self, path, events, threads):
+        pid = os.getpid()
+        trace = [{"ph": "M", "name": "process_name", "pid": pid, "tid": 0, "args": {"name": "Pressure Reader"}}]
+        for tid, name in threads.items():
+            trace.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}})
+        for phase, name, start, value, tid in events:
+            event = {"ph": phase, "name": name, "pid": pid, "tid": tid, "ts": (start - self.origin) / 1000}
+            if phase == "X":
+                event["dur"] = value / 1000
+            else:
+                event["cat"] = "block"
+                event["id"] = str(value)
+            trace.append(event)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+
+TRACER = Tracer()
@@ -0,0 +1,184 @@
+import json
+import logging
+import math
+import os
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+from config import CONFIG_DIR
+from gauge import convertPressure
+
+
+# Full bandwidth captures around events such as a vent, an arc or a burst. The
+# acquisition process checks every raw block against the conditions and keeps the last
+# pre_seconds of raw blocks in a preallocated ring. When a condition starts to hold it
+# collects post_seconds more and hands the window to a writer thread, which saves it as
+# ~/.pressure_reader/captures/capture-<time>.npz. Conditions, each on one sensor:
+#   {"sensor": 0, "above": 1e-2}, {"sensor": 0, "below": 1e-6}
+#       any raw sample beyond the pressure (mbar, through the gauge calibration)
+#   {"sensor": 0, "slope": 0.5}
+#       any step between consecutive raw samples faster than this many volts per ms
+#   {"sensor": 0, "rate": 1.0}
+#       the block pressure changing faster than this many decades per second
+# The capture file holds data (channels x samples, volts, float32), sample_rate,
+# start_time (epoch seconds of the first sample), trigger_sample and trigger (JSON of
+# the condition that fired).
+
+log = logging.getLogger(__name__)
+
+CAPTURE_DIR = os.path.join(CONFIG_DIR, "captures")
+# Capture buffers, one being filled while the writer still saves the other
+BUFFERS = 2
+
+
+class CaptureTrigger:
+    def __init__(self, conditions, lut, nr_channels, nr_samples, samplingRate, readRate, preSeconds=2.0, postSeconds=2.0,
+                 holdoff=10.0, directory=CAPTURE_DIR, listener=None):
+        self.nr_samples = nr_samples
+        self.samplingRate = samplingRate
+        self.readRate = readRate
+        self.holdoff = holdoff
+        self.directory = directory
+        self.listener = listener
+        self.conditions = conditions
+
+        # Pressure levels become voltage levels on each channel's calibration curve, so
+        # raw samples are compared without converting them
+        levels = [(i, c) for i, c in enumerate(conditions) if "above" in c or "below" in c]
+        self.levelIndex = [i for i, c in levels]
+        self.levelSensors = np.array([c["sensor"] for i, c in levels], dtype=np.intp)
+        self.levelAbove = np.array(["above" in c for i, c in levels], dtype=bool)
+        grid = np.linspace(lut.VMIN, lut.VMAX, lut.size + 1)
+        self.levelVolts = np.array([np.interp(convertPressure(c["above"] if "above" in c else c["below"], "mbar", lut.unit),
+                                              lut.table[c["sensor"]], grid) for i, c in levels])
+        slopes = [(i, c) for i, c in enumerate(conditions) if "slope" in c]
+        self.slopeIndex = [i for i, c in slopes]
+        self.slopeSensors = np.array([c["sensor"] for i, c in slopes], dtype=np.intp)
+        self.slopeVolts = np.array([c["slope"] * 1000.0 / samplingRate for i, c in slopes])
+        rates = [(i, c) for i, c in enumerate(conditions) if "rate" in c]
+        self.rateIndex = [i for i, c in rates]
+        self.rateSensors = np.array([c["sensor"] for i, c in rates], dtype=np.intp)
+        self.rateLimits = np.array([c["rate"] for i, c in rates])
+        self.lastLog = None
+
+        self.preBlocks = math.ceil(preSeconds / readRate)
+        self.postBlocks = math.ceil(postSeconds / readRate)
+        self.ring = np.zeros((self.preBlocks, nr_channels, nr_samples))
+        self.ringTimes = np.zeros(self.preBlocks)
+        self.ringCount = 0
+        self.free = queue.Queue()
+        for i in range(BUFFERS):
+            self.free.put(np.zeros((self.preBlocks + 1 + self.postBlocks, nr_channels, nr_samples)))
+
+        self.holding = np.zeros(len(conditions), dtype=bool)
+        self.lastTrigger = -math.inf
+        self.capture = None
+        self.jobs = queue.Queue()
+        self.writer = threading.Thread(target=self.write, name="CaptureWriter", daemon=True)
+        self.writer.start()
+
+    @classmethod
+    def fromSettings(cls, settings, lut, nr_channels, nr_samples, samplingRate, readRate, listener=None):
+        # None when capturing is off or no condition applies to the acquired channels
+        if not settings.get("enabled"):
+            return None
+        conditions = [c for c in settings.get("conditions", []) if 0 <= c.get("sensor", -1) < nr_channels
+                      and any(key in c for key in ("above", "below", "slope", "rate"))]
+        if not conditions:
+            return None
+        return cls(conditions, lut, nr_channels, nr_samples, samplingRate, readRate, settings.get("pre_seconds", 2.0),
+                   settings.get("post_seconds", 2.0), settings.get("holdoff", 10.0), listener=listener)
+
+    def check(self, block, pressures):
+        # Per condition, the first sample where it holds in this block or -1
+        first = np.full(len(self.conditions), -1, dtype=np.intp)
+        if len(self.levelSensors):
+            data = block[self.levelSensors]
+            hits = np.where(self.levelAbove[:, None], data > self.levelVolts[:, None], data < self.levelVolts[:, None])
+            first[self.levelIndex] = np.where(hits.any(axis=1), hits.argmax(axis=1), -1)
+        if len(self.slopeSensors):
+            hits = np.abs(np.diff(block[self.slopeSensors], axis=1)) > self.slopeVolts[:, None]
+            first[self.slopeIndex] = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, -1)
+        if len(self.rateSensors):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                logPressure = np.log10(pressures[self.rateSensors])
+                if self.lastLog is not None:
+                    hits = np.abs(logPressure - self.lastLog) / self.readRate > self.rateLimits
+                    first[self.rateIndex] = np.where(hits, 0, -1)
+            self.lastLog = logPressure
+        return first
+
+    def process(self, block, timestamp, pressures):
+        first = self.check(block, pressures)
+        holding = first >= 0
+        fired = np.flatnonzero(holding & ~self.holding)
+        self.holding = holding
+
+        if self.capture is not None:
+            self.append(block)
+        elif len(fired) and timestamp - self.lastTrigger >= self.holdoff:
+            self.lastTrigger = timestamp
+            self.begin(block, timestamp, int(fired[0]), int(first[fired[0]]))
+
+        # The pre-trigger ring always holds the newest blocks, ready for the next trigger
+        i = self.ringCount % self.preBlocks
+        self.ring[i] = block
+        self.ringTimes[i] = timestamp
+        self.ringCount += 1
+
+    def begin(self, block, timestamp, condition, sample):
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            log.warning("Capture skipped, the previous captures are still being written")
+            return
+        pre = min(self.ringCount, self.preBlocks)
+        order = np.arange(self.ringCount - pre, self.ringCount) % self.preBlocks
+        buffer[:pre] = self.ring[order]
+        firstTime = self.ringTimes[order[0]] if pre else timestamp
+        log.info("Capture triggered by %s", json.dumps(self.conditions[condition]))
+        self.capture = {"buffer": buffer, "blocks": pre, "start_time": firstTime - self.readRate,
+                        "trigger_sample": pre * self.nr_samples + sample, "trigger": self.conditions[condition]}
+        self.append(block)
+
+    def append(self, block):
+        capture = self.capture
+        capture["buffer"][capture["blocks"]] = block
+        capture["blocks"] += 1
+        if capture["blocks"] == len(capture["buffer"]):
+            self.finish()
+
+    def finish(self):
+        self.jobs.put(self.capture)
+        self.capture = None
+
+    def write(self):
+        while True:
+            capture = self.jobs.get()
+            if capture is None:
+                return
+            buffer = capture["buffer"]
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                name = datetime.fromtimestamp(capture["start_time"]).strftime("capture-%Y%m%d-%H%M%S-%f")[:-3] + ".npz"
+                path = os.path.join(self.directory, name)
+                data = buffer[:capture["blocks"]].transpose(1, 0, 2).reshape(buffer.shape[1], -1).astype(np.float32)
+                # Written under a temporary name so a half written file is never picked up
+                with open(path + ".part", "wb") as file:
+                    np.savez(file, data=data, sample_rate=self.samplingRate, start_time=capture["start_time"],
+                             trigger_sample=capture["trigger_sample"], trigger=json.dumps(capture["trigger"]))
+                os.replace(path + ".part", path)
+                if self.listener is not None:
+                    self.listener(path)
+            except OSError:
+                log.exception("Capture could not be written")
+            finally:
+                self.free.put(buffer)
+
+    def close(self):
+        # A capture still collecting post-trigger blocks is written as far as it got
+        if self.capture is not None:
+            self.finish()
+        self.jobs.put(None)
+        self.writer.join()